@@ -0,0 +1,86 @@
+"""
+Per-call statement overhead of the CRUDBase lookups.
+
+Usage: python benchmarks/crud_statements.py [-n ITERATIONS]
+
+Measures what SQLAlchemy does before a lookup reaches the driver: build the
+statement, compute its cache key and fetch its compiled form from the cache.
+The `per call` rows measure the previous code path, which built a new select
+on every call. The last table counts the distinct SQL strings sent for id lists
+of 1 to 100 ids, asyncpg prepares one statement per string.
+No database is needed, the application settings must be set in the environment.
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.util import LRUCache
+from sqlmodel import select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from crud.base_crud import CRUDBase  # noqa: E402
+from models import User  # noqa: E402
+
+DIALECT = postgresql.asyncpg.dialect()
+IDS = [uuid.uuid4() for _ in range(10)]
+
+
+def _prepare(statement, compiled_cache: LRUCache):
+    # the steps Connection.execute runs before calling the driver
+    compiled, _, _ = statement._compile_w_cache(DIALECT, compiled_cache=compiled_cache, column_keys=[])
+    return compiled
+
+
+def _rate(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def bench_lookups(iterations: int):
+    crud = CRUDBase(User)
+    compiled_cache = LRUCache(500)
+    return [
+        (
+            "get per call",
+            _rate(lambda: _prepare(select(User).where(User.id == IDS[0]), compiled_cache), iterations),
+        ),
+        ("get cached", _rate(lambda: _prepare(crud._get_by_statement("id"), compiled_cache), iterations)),
+        (
+            "get_by_ids per call",
+            _rate(lambda: _prepare(select(User).where(User.id.in_(IDS)), compiled_cache), iterations),
+        ),
+        ("get_by_ids cached", _rate(lambda: _prepare(crud._get_by_ids_statement(), compiled_cache), iterations)),
+    ]
+
+
+def count_statements(max_ids: int):
+    crud = CRUDBase(User)
+    ids = [uuid.uuid4() for _ in range(max_ids)]
+    render = {"render_postcompile": True}
+    in_sql = {
+        str(select(User).where(User.id.in_(ids[:n])).compile(dialect=DIALECT, compile_kwargs=render))
+        for n in range(1, max_ids + 1)
+    }
+    any_sql = {str(crud._get_by_ids_statement().compile(dialect=DIALECT)) for _ in range(1, max_ids + 1)}
+    return len(in_sql), len(any_sql)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'lookup':<22} {'calls/s':>10} {'us/call':>10}")
+    for name, rate in bench_lookups(args.iterations):
+        print(f"{name:<22} {rate:>10.0f} {1e6 / rate:>10.1f}")
+
+    in_count, any_count = count_statements(100)
+    print(f"\n{'get_by_ids':<22} {'statements':>10}")
+    print(f"{'IN (...)':<22} {in_count:>10}")
+    print(f"{'= ANY(:ids)':<22} {any_count:>10}")
@@ -0,0 +1,96 @@
+"""
+Encode/decode throughput of the JWT codec backends.
+
+Usage: python benchmarks/jwt_codec.py [-n ITERATIONS]
+
+The `python-jose (jwt.decode)` rows measure the previous code path, which
+parsed the header and constructed the key on every call.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.jwt_codec import BACKENDS, JWTCodec, JWTError, get_backend  # noqa: E402
+
+SECRET = "KJMAgRxFdlijZPU8KLLWiJYsebxcDxpTMZDDqGRjJZg"
+
+
+def _pem(private_key) -> str:
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+KEYS = {
+    "HS256": SECRET,
+    "RS256": _pem(rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+    "ES256": _pem(ec.generate_private_key(ec.SECP256R1())),
+    "EdDSA": _pem(ed25519.Ed25519PrivateKey.generate()),
+}
+
+
+def _claims():
+    return {"sub": "0190f1e6-4c4b-7c6e-8000-000000000000", "exp": datetime.utcnow() + timedelta(hours=1)}
+
+
+def _rate(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def bench_codec(backend_name: str, algorithm: str, iterations: int):
+    backend = get_backend(backend_name)
+    codec = JWTCodec(backend, [algorithm])
+    if algorithm.startswith("HS"):
+        signing_key = verifying_key = backend.load_secret(KEYS[algorithm], algorithm)
+    else:
+        signing_key = backend.load_private_key(KEYS[algorithm], algorithm)
+        verifying_key = backend.public_key(signing_key)
+    token = codec.encode(_claims(), signing_key, algorithm, kid="bench")
+    encode = _rate(lambda: codec.encode(_claims(), signing_key, algorithm, kid="bench"), iterations)
+    decode = _rate(lambda: codec.decode(token, lambda _: verifying_key), iterations)
+    return encode, decode
+
+
+def bench_jose(algorithm: str, iterations: int):
+    from jose import jwk, jwt
+
+    key = KEYS[algorithm]
+    public = key if algorithm.startswith("HS") else jwk.construct(key, algorithm).public_key().to_pem().decode()
+    token = jwt.encode(_claims(), key, algorithm=algorithm)
+
+    def decode():
+        alg = jwt.get_unverified_header(token).get("alg")
+        jwt.decode(token, public, algorithms=alg)
+
+    return _rate(lambda: jwt.encode(_claims(), key, algorithm=algorithm), iterations), _rate(decode, iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'backend':<26} {'alg':<6} {'encode/s':>10} {'decode/s':>10}")
+    for algorithm in KEYS:
+        rows = []
+        for name in BACKENDS:
+            try:
+                rows.append((name, *bench_codec(name, algorithm, args.iterations)))
+            except JWTError as e:
+                print(f"{name:<26} {algorithm:<6} {'-':>10} {'-':>10}  ({e})")
+        if algorithm != "EdDSA":
+            rows.append(("python-jose (jwt.decode)", *bench_jose(algorithm, args.iterations)))
+        for name, encode, decode in rows:
+            print(f"{name:<26} {algorithm:<6} {encode:>10.0f} {decode:>10.0f}")
@@ -1,15 +1,20 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer
 from fastapi_mail import ConnectionConfig, FastMail
 
 import crud
 from core.security import JWSBearer
+from middlewares.asql import set_transaction_mode
+from middlewares.timing import get_ctx_stats
+from models.group_model import GroupEnum
 from models.user_model import User
-from schemas.common_schema import IMetaGeneral
-from schemas.user_schema import IUserCreate, IUserSignup
+from schemas.common_schema import ICountStrategyEnum, IMetaGeneral
+from schemas.user_schema import IUserCreate, IUserPrincipal, IUserSignup
+from utils.count import set_count_strategy
+from utils.principal_cache import principal_cache
 
 
 async def get_general_meta() -> IMetaGeneral:
@@ -17,38 +22,120 @@ async def get_general_meta() -> IMetaGeneral:
     return IMetaGeneral(roles=current_roles)
 
 
+def _check_scopes(jwt_payload: Dict[str, Any], required_scopes: List[str]):
+    if required_scopes:
+        if user_scopes := jwt_payload.get("scopes"):
+            if required_scopes not in user_scopes:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="You don't have enough permissions for this action",
+                )
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Missing scopes",
+            )
+
+
 def get_current_user(
     bearer_token: HTTPBearer = JWSBearer(),
     required_scopes: List[str] = [],
+    load: Optional[str] = None,
 ) -> User:
+    """
+    The authenticated user, with the relationships of the `load` profile of crud.user
+    """
+
     async def current_user(
         jwt_payload: Dict[str, Any] = Depends(bearer_token),
     ) -> User:
-        user: User = await crud.user.get(id=jwt_payload["sub"])
+        user: User = await crud.user.get(id=jwt_payload["sub"], load=load)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         if not user.is_active:
             raise HTTPException(status_code=400, detail="Inactive user")
 
-        if required_scopes:
-            if user_scopes := jwt_payload.get("scopes"):
-                if required_scopes not in user_scopes:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="You don't have enough permissions for this action",
-                    )
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="Missing scopes",
-                )
-
+        _check_scopes(jwt_payload, required_scopes)
         return user
 
     return current_user
 
 
+def get_current_principal(
+    bearer_token: HTTPBearer = JWSBearer(),
+    required_scopes: List[str] = [],
+) -> IUserPrincipal:
+    """
+    Same checks as get_current_user, for endpoints that only need the user id, status, role and groups.
+    The principal is served from cache, the database is only queried on a miss.
+    """
+
+    async def current_principal(
+        jwt_payload: Dict[str, Any] = Depends(bearer_token),
+    ) -> IUserPrincipal:
+        principal = await principal_cache.get(jwt_payload["sub"], crud.user.get_principal)
+        if not principal:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if not principal.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+
+        _check_scopes(jwt_payload, required_scopes)
+        return principal
+
+    return current_principal
+
+
+def in_group(group: GroupEnum):
+    """Answers 403 unless the authenticated user is in `group`."""
+
+    async def check_group(
+        current_user: IUserPrincipal = Depends(get_current_principal()),
+    ):
+        if group not in current_user.groups:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+    return check_group
+
+
+def transaction(read_only: bool = False, deferrable: bool = False):
+    """
+    Overrides the transaction mode of a route, GET routes are READ ONLY by default.
+    `deferrable` runs a READ ONLY snapshot that never fails on serialization, for heavy listings.
+    Must be declared in the route `dependencies` so it runs before the session is used.
+    """
+
+    def transaction_mode():
+        set_transaction_mode(read_only=read_only, deferrable=deferrable)
+
+    return transaction_mode
+
+
+def statement_budget(limit: int):
+    """Number of SQL statements a route is expected to run, requests going over it are logged."""
+
+    def set_statement_budget():
+        if stats := get_ctx_stats():
+            stats.statement_budget = limit
+
+    return set_statement_budget
+
+
+def count_strategy(strategy: ICountStrategyEnum):
+    """
+    How a route counts the total of its paginated listing, see `count_rows`.
+    The `count` query parameter overrides it for a request.
+    """
+
+    def set_strategy(
+        count: Optional[ICountStrategyEnum] = Query(None, description="how the total is counted"),
+    ):
+        set_count_strategy(count or strategy)
+
+    return set_strategy
+
+
 async def user_exists(new_user: IUserSignup | IUserCreate) -> IUserCreate:
     user = await crud.user.get_by("email", new_user.email)
     if user:
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from api.v1.endpoints import blazeql, group, login, role, user
+from api.v1.endpoints import blazeql, group, login, metrics, role, user
 
 api_router = APIRouter()
 
@@ -9,3 +9,4 @@ api_router.include_router(role.router, prefix="/role", tags=["role"])
 api_router.include_router(user.router, prefix="/user", tags=["user"])
 api_router.include_router(group.router, prefix="/group", tags=["group"])
 api_router.include_router(blazeql.router, prefix="/blazeql", tags=["blazeql"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
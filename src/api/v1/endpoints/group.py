@@ -1,29 +1,65 @@
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, status
+from fastapi.responses import StreamingResponse
 from fastapi_pagination import Params
 
 import crud
+from api.deps import count_strategy, in_group, transaction
 from exceptions import ContentNoChangeException, IdNotFoundException, NameExistException
-from models.group_model import Group
+from models.group_model import Group, GroupEnum
 from models.user_model import User
+from schemas.common_schema import CursorQuery, FilterQuery, ICountStrategyEnum, IExportFormatEnum
 from schemas.group_schema import IGroupCreate, IGroupRead, IGroupUpdate
-from schemas.response_schema import IResponse, IResponsePage, create_response
+from schemas.response_schema import IResponse, IResponseCursorPage, IResponsePage, create_response
+from utils.export import export_response
 
 router = APIRouter()
 
 
-@router.get("/list", response_model=IResponsePage[IGroupRead])
+@router.get(
+    "/list",
+    response_model=IResponsePage[IGroupRead],
+    dependencies=[Depends(count_strategy(ICountStrategyEnum.cached))],
+)
 async def get_groups(
     params: Params = Depends(),
 ):
     """
     Gets a paginated list of groups
     """
-    groups = await crud.group.get_multi_paginated(params=params)
+    groups = await crud.group.get_multi_paginated(params=params, load="read")
+    return create_response(data=groups)
+
+
+@router.get("/list/cursor", response_model=IResponseCursorPage[IGroupRead])
+async def get_groups_cursor(
+    params: CursorQuery = Depends(),
+):
+    """
+    Gets a list of groups page by page, following the next_cursor of the previous page
+    """
+    groups = await crud.group.get_multi_cursor_paginated(params=params, load="read")
     return create_response(data=groups)
 
 
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(transaction(deferrable=True)), Depends(in_group(GroupEnum.admin))],
+)
+async def export_groups(
+    filters: FilterQuery = Depends(),
+    format: IExportFormatEnum = IExportFormatEnum.ndjson,
+):
+    """
+    Exports the groups matching the filter as NDJSON, CSV or Parquet. Requires admin group
+    """
+    columns = crud.group.get_export_columns(IGroupRead)
+    partitions = await crud.group.stream_multi_filtered(columns=columns, filters=filters)
+    return export_response(format, "groups", columns, partitions)
+
+
 @router.get("/{group_id}", response_model=IResponse[IGroupRead])
 async def get_group_by_id(
     group_id: UUID,
@@ -31,7 +67,7 @@ async def get_group_by_id(
     """
     Gets a group by its id
     """
-    group = await crud.group.get(id=group_id)
+    group = await crud.group.get(id=group_id, load="read")
     if group:
         return create_response(data=group)
     else:
@@ -52,7 +88,7 @@ async def create_group(
     group_current = await crud.group.get_group_by_name(name=group.name)
     if group_current:
         raise NameExistException(Group, name=group.name)
-    new_group = await crud.group.create(obj_in=group)
+    new_group = await crud.group.create(obj_in=group, load="read")
     return create_response(data=new_group)
 
 
@@ -71,7 +107,7 @@ async def update_group(
     if group_current.name == group.name and group_current.description == group.description:
         raise ContentNoChangeException()
 
-    group_updated = await crud.group.update(obj_current=group_current, obj_new=group)
+    group_updated = await crud.group.update(obj_current=group_current, obj_new=group, load="read")
     return create_response(data=group_updated)
 
 
@@ -85,7 +121,7 @@ async def delete_group(
     group = await crud.group.get(id=group_id)
     if not group:
         raise IdNotFoundException(Group, group_id)
-    group = await crud.group.delete(id=group_id)
+    group = await crud.group.delete(id=group_id, load="read")
     return create_response(data=group)
 
 
@@ -6,34 +6,33 @@ from fastapi_mail import FastMail, MessageSchema, MessageType
 from pydantic import EmailStr
 
 import crud
-from api.deps import get_current_user, get_mail_manager
+from api.deps import get_current_principal, get_mail_manager, transaction
 from core.security import TokenType, create_token, jwt_decode
 from exceptions.common_exception import IdNotFoundException
 from models.group_model import GroupEnum
 from models.user_model import User
 from schemas.response_schema import IResponse, create_response
-from schemas.user_schema import IUserRead
-from utils.token import get_tokens
+from schemas.user_schema import IUserPrincipal, IUserRead
+from utils.token import check_token
 
 router = APIRouter()
 
 
-@router.get("/verify-email")
+@router.get("/verify-email", dependencies=[Depends(transaction(read_only=False))])
 async def verify_email_callback(
     request: Request,
     redirect_url: str = Query(),
     token: str = Query(),
     fm: FastMail = Depends(get_mail_manager),
 ):
-    user_id = jwt_decode(token)["sub"]
+    payload = jwt_decode(token)
+    user_id = payload["sub"]
     user = await crud.user.get(id=user_id)
 
     if user is None:
         raise IdNotFoundException(User, user_id)
 
-    valid_tokens = await get_tokens(user_id, TokenType.ID)
-
-    if valid_tokens and token not in valid_tokens:
+    if not await check_token(user_id, payload.get("jti"), token, TokenType.JWT):
         token = await create_token(user.id)
         message = MessageSchema(
             subject="Verify Your Email",
@@ -62,7 +61,7 @@ async def verify_email(
     request: Request,
     user_id: UUID = Body(...),
     redirect_url: str = Body(),
-    current_user: User = Depends(get_current_user()),
+    current_user: IUserPrincipal = Depends(get_current_principal()),
     fm: FastMail = Depends(get_mail_manager),
 ):
     if GroupEnum.admin not in current_user.groups and current_user.id != user_id:
@@ -95,7 +94,7 @@ async def update_email(
     email: EmailStr = Body(...),
     redirect_url: str = Body(...),
     verified: bool = Body(False),
-    current_user: User = Depends(get_current_user()),
+    current_user: IUserPrincipal = Depends(get_current_principal()),
     fm: FastMail = Depends(get_mail_manager),
 ):
     if GroupEnum.admin not in current_user.groups and current_user.id != user_id:
@@ -107,7 +106,7 @@ async def update_email(
     if user is None:
         raise IdNotFoundException(User, user_id)
 
-    user = await crud.user.update(obj_current=user, obj_new={"email": email, "email_verified": verified})
+    user = await crud.user.update(obj_current=user, obj_new={"email": email, "email_verified": verified}, load="read")
 
     if not verified:
         token = await create_token(user.id)
@@ -2,24 +2,33 @@ import logging
 import random
 import string
 
-from fastapi import APIRouter, Body, Depends, Form, HTTPException, Query, Request, status
+from fastapi import APIRouter, Body, Depends, Form, HTTPException, Query, Request, Response, status
 from fastapi.responses import RedirectResponse
 from fastapi_mail import FastMail, MessageSchema, MessageType
 from pydantic import EmailStr
 from redis.asyncio import Redis
 
 import crud
-from api.deps import get_current_user, get_mail_manager, user_exists
+from api.deps import get_current_principal, get_current_user, get_mail_manager, transaction, user_exists
+from core.keyring import keyring
 from core.security import Token, TokenType, create_token, get_password_hash, refresh_token, verify_password
+from core.settings import settings
 from middlewares.redis import get_ctx_client
 from models.role_model import RoleEnum
 from models.user_model import User
 from schemas.response_schema import create_response
-from schemas.user_schema import IUserCreate, IUserRead, IUserSignup
+from schemas.user_schema import IUserCreate, IUserPrincipal, IUserRead, IUserSignup
+from utils.ratelimit import RateLimiter
 from utils.token import delete_tokens
 
 router = APIRouter()
 
+auth_limiter = RateLimiter("auth", account_field="username")
+signin_limiter = RateLimiter("signin", account_field="email")
+signup_limiter = RateLimiter("signup", account_field="email")
+reset_password_limiter = RateLimiter("reset-password", account_field="email")
+change_password_limiter = RateLimiter("change-password")
+
 
 class OAuth2PasswordRequestForm:
     """Modified from fastapi.security.OAuth2PasswordRequestForm"""
@@ -46,7 +55,7 @@ async def _authenticate(email: EmailStr, password: str) -> User:
     return user
 
 
-@router.post("/auth", response_model=Token)
+@router.post("/auth", response_model=Token, dependencies=[Depends(auth_limiter)])
 async def auth(
     form_data: OAuth2PasswordRequestForm = Depends(),
 ):
@@ -55,6 +64,7 @@ async def auth(
     """
     if form_data.grant_type == "password":
         user = await _authenticate(form_data.username, form_data.password)
+        await auth_limiter.reset(form_data.username)
         data = await create_token(user.id)
     elif form_data.grant_type == "refresh_token":
         data = await refresh_token(form_data.refresh_token)
@@ -63,7 +73,12 @@ async def auth(
     return data
 
 
-@router.post("/signup", response_model=Token, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/signup",
+    response_model=Token,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(signup_limiter)],
+)
 async def signup(
     request: Request,
     fm: FastMail = Depends(get_mail_manager),
@@ -95,7 +110,7 @@ async def signup(
     return data
 
 
-@router.post("/signin", response_model=Token)
+@router.post("/signin", response_model=Token, dependencies=[Depends(signin_limiter)])
 async def signin(
     email: EmailStr = Body(...),
     password: str = Body(...),
@@ -104,6 +119,7 @@ async def signin(
     Login for all users
     """
     user = await _authenticate(email, password)
+    await signin_limiter.reset(email)
     data = await create_token(user.id)
     return data
 
@@ -111,7 +127,7 @@ async def signin(
 @router.post("/signout")
 async def signout(
     redirect_url: str = Query("/"),
-    current_user: User = Depends(get_current_user()),
+    current_user: IUserPrincipal = Depends(get_current_principal()),
 ):
     await delete_tokens(current_user.id, TokenType.JWT)
     response = RedirectResponse(url=redirect_url)
@@ -119,7 +135,11 @@ async def signout(
     return response
 
 
-@router.get("/reset-password", response_model=IUserRead)
+@router.get(
+    "/reset-password",
+    response_model=IUserRead,
+    dependencies=[Depends(reset_password_limiter), Depends(transaction(read_only=False))],
+)
 async def reset_password(
     email: EmailStr = Query(),
     fm: FastMail = Depends(get_mail_manager),
@@ -127,7 +147,7 @@ async def reset_password(
     """
     Reset password
     """
-    current_user = await crud.user.get_by("email", email)
+    current_user = await crud.user.get_by("email", email, load="read")
     if not current_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
@@ -135,8 +155,8 @@ async def reset_password(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
 
     new_password = "".join(random.choice(string.printable) for i in range(8))
-    new_hashed_password = get_password_hash(new_password)
-    await crud.user.update(obj_current=current_user, obj_new={"hashed_password": new_hashed_password})
+    new_hashed_password = await get_password_hash(new_password)
+    await crud.user.update(obj_current=current_user, obj_new={"hashed_password": new_hashed_password}, load="read")
 
     message = MessageSchema(
         subject="Password Reset",
@@ -151,7 +171,7 @@ async def reset_password(
     return create_response(data=current_user)
 
 
-@router.post("/change-password", response_model=Token)
+@router.post("/change-password", response_model=Token, dependencies=[Depends(change_password_limiter)])
 async def change_password(
     current_password: str = Body(...),
     new_password: str = Body(...),
@@ -161,18 +181,20 @@ async def change_password(
     """
     Change password
     """
+    await change_password_limiter.hit(account=str(current_user.id), redis_client=redis_client)
 
-    if not verify_password(current_password, current_user.hashed_password):
+    if not await verify_password(current_password, current_user.hashed_password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Current Password")
 
-    if verify_password(new_password, current_user.hashed_password):
+    if await verify_password(new_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New Password should be different that the current one",
         )
 
-    new_hashed_password = get_password_hash(new_password)
+    new_hashed_password = await get_password_hash(new_password)
     await crud.user.update(obj_current=current_user, obj_new={"hashed_password": new_hashed_password})
+    await change_password_limiter.reset(str(current_user.id), redis_client)
 
     await delete_tokens(current_user.id, TokenType.JWT, redis_client)
 
@@ -182,7 +204,7 @@ async def change_password(
 
 @router.get("/userinfo", response_model=IUserRead)
 async def userinfo(
-    current_user: User = Depends(get_current_user()),
+    current_user: User = Depends(get_current_user(load="read")),
 ):
     """
     Returns the user's information
@@ -198,8 +220,9 @@ async def well_known(request: Request):
         "token_endpoint": base_url + "/auth",
         "authorization_endpoint": base_url + "/auth",
         "userinfo_endpoint": base_url + "/userinfo",
+        "jwks_uri": base_url + "/.well-known/jwks.json",
         "response_types_supported": ["id_token", "token id_token"],
-        "id_token_signing_alg_values_supported": ["HS256"],
+        "id_token_signing_alg_values_supported": [settings.ALGORITHM],
         "response_modes_supported": ["query"],
         "subject_types_supported": ["public", "pairwise"],
         "grant_types_supported": ["password"],
@@ -210,3 +233,12 @@ async def well_known(request: Request):
         "request_uri_parameter_supported": False,
         "scopes_supported": ["openid", "profile"],
     }
+
+
+@router.get("/.well-known/jwks.json")
+async def jwks(response: Response):
+    """
+    Public keys used to sign tokens, downstream services can verify tokens locally with them
+    """
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return keyring.jwks()
@@ -2,13 +2,19 @@ from typing import Any, Dict
 from uuid import UUID
 
 import petname
-from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Body, Depends, HTTPException, status
 from fastapi.responses import PlainTextResponse
-from siwe import SiweMessage, VerificationError
-from uuid6 import uuid7
 
 import crud
-from core.security import Token, TrustedJWSBearer, JWSBearer, create_nonce, create_token, jws_bearer, revoke_token
+from core.security import (
+    Token,
+    TrustedJWSBearer,
+    JWSBearer,
+    create_token,
+    jws_bearer,
+    revoke_token,
+    verify_siwe_message,
+)
 from core.settings import settings
 from exceptions.common_exception import NameNotFoundException
 from middlewares.asql import AsyncSession, get_ctx_session
@@ -18,7 +24,7 @@ from schemas.login_schema import IUserAuthInfo
 from schemas.response_schema import IResponse, create_response
 from schemas.user_schema import IUserCreate, IUserRead, IUserUpsert
 from schemas.wallet_schema import IWalletCreate
-from utils.nonce import get_nonce
+from utils.nonce import claim_nonce, create_nonce, extract_nonce, nonce_expires_in
 
 router = APIRouter()
 
@@ -36,29 +42,26 @@ reusable_jwt_bearer = JWSBearer()
 
 @router.post("/verify", response_model=IUserAuthInfo)
 async def verify(
-    request: Request,
     message: str = Body(...),
     signature: str = Body(...),
 ):
-    session_id = request.session.get("siwe", None)
-    if not session_id:
+    nonce = extract_nonce(message)
+    if not nonce or not (expires_in := nonce_expires_in(nonce)):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found",
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired nonce",
         )
 
-    nonce = await get_nonce(session_id)
+    address, chain_id = await verify_siwe_message(message, signature, nonce)
 
-    try:
-        siwe_message: SiweMessage = SiweMessage(message=message)
-        siwe_message.verify(signature, nonce=nonce)
-    except VerificationError as e:
+    # claimed once the signature is valid, so invalid attempts can not burn the nonce of a genuine client
+    if not await claim_nonce(nonce, expires_in):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=str(e),
+            detail="Nonce already used",
         )
 
-    wallet = await crud.wallet.get_by("address", siwe_message.address)
+    wallet = await crud.wallet.get_by("public_key", address)
     if not wallet:
         full_name = petname.generate(words=2, separator=" ").split(" ")
         role = await crud.role.get_by("name", RoleEnum.citizen)
@@ -71,22 +74,17 @@ async def verify(
             )
         )
         await crud.group.add_user_to_group(user=user, group_id=group.id)
-        await crud.user.refresh(user)
         wallet = await crud.wallet.create(
-            IWalletCreate(chain_id=siwe_message.chain_id, public_key=siwe_message.address, user_id=user.id)
+            IWalletCreate(chain=str(chain_id), public_key=address, user_id=user.id)
         )
+    user = await crud.user.get(wallet.user_id, load="read")
     token = await create_token(wallet.user_id)
-    return IUserAuthInfo(user_info=wallet.user, **token.dict())
+    return IUserAuthInfo(user_info=user, **token.dict())
 
 
 @router.get("/nonce", response_class=PlainTextResponse)
-async def nonce(
-    request: Request,
-):
-    session_id = uuid7()
-    request.session["siwe"] = str(session_id)
-    nonce = await create_nonce(session_id)
-    return nonce
+async def nonce():
+    return create_nonce()
 
 
 @router.post("/refresh", response_model=Token)
@@ -151,31 +149,21 @@ async def register(
     wallets = user.wallets
     if wallets is not None:
         if wallets == []:
-            await crud.wallet.delete_all_user_wallets(user_found.id)
+            await crud.wallet.delete_all_user_wallets(user_found.id, db_session=db)
         else:
+            await crud.wallet.upsert_multi(wallets, db_session=db)
             for wallet in wallets:
-                if wallet_found := await crud.wallet.get(wallet.id, db_session=db):
-                    await crud.wallet.update(obj_current=wallet_found, obj_new=wallet, db_session=db)
-                else:
-                    await crud.wallet.create(wallet, db_session=db)
                 if wallet.name == user.primary_wallet:
-                    user_found = await crud.user.update(
-                        obj_current=user_found, obj_new={"primary_wallet_id": wallet.id}, db_session=db
-                    )
+                    user_found.primary_wallet_id = wallet.id
 
     social_accounts = user.social_accounts
     if social_accounts is not None:
         if social_accounts == []:
-            await crud.socialaccount.delete_all_user_wallets(user_found.id, db_session=db)
+            await crud.socialaccount.delete_all_user_socialaccounts(user_found.id, db_session=db)
         else:
-            for account in social_accounts:
-                if account_found := await crud.socialaccount.get(account.id, db_session=db):
-                    await crud.socialaccount.update(obj_current=account_found, obj_new=account, db_session=db)
-                else:
-                    await crud.socialaccount.create(account, db_session=db)
-
-    await db.flush()
-    await db.refresh(user_found)
+            await crud.socialaccount.upsert_multi(social_accounts, db_session=db)
+
+    user_found = await crud.user.refresh(user_found, db_session=db, load="read")
     return create_response(data=user_found)
 
 
@@ -185,7 +173,7 @@ async def unlink_wallet(
     wallet_id: UUID = Body(...),
 ):
     user = await crud.user.get(jwt["sub"])
-    return await crud.user.unlink_wallet(user, wallet_id)
+    return await crud.user.unlink_wallet(user, wallet_id, load="read")
 
 
 @router.post("/socialaccount/unlik", response_model=IUserRead)
@@ -194,4 +182,4 @@ async def unlink_socialaccounts(
     account_id: UUID = Body(...),
 ):
     user = await crud.user.get(jwt["sub"])
-    return await crud.user.unlink_socialaccount(user, account_id)
+    return await crud.user.unlink_socialaccount(user, account_id, load="read")
@@ -0,0 +1,47 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from api.deps import get_current_principal
+from core.hashing import password_hasher
+from core.signatures import signature_verifier
+from middlewares.asql import get_pool_stats
+from models.group_model import GroupEnum
+from schemas.response_schema import IResponse, create_response
+from schemas.user_schema import IUserPrincipal
+from utils.slow_queries import slow_query_log
+
+router = APIRouter()
+
+
+def _check_admin(current_user: IUserPrincipal):
+    if GroupEnum.admin not in current_user.groups:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+
+@router.get("", response_model=IResponse[Dict[str, Any]])
+async def get_metrics(
+    current_user: IUserPrincipal = Depends(get_current_principal()),
+):
+    """
+    Connection and worker pool statistics of the worker answering the request. Requires admin group
+    """
+    _check_admin(current_user)
+    return create_response(
+        data={
+            "database": get_pool_stats(),
+            "workers": [password_hasher.pool.get_stats(), signature_verifier.pool.get_stats()],
+        }
+    )
+
+
+@router.get("/slow-queries", response_model=IResponse[Dict[str, Any]])
+async def get_slow_queries(
+    current_user: IUserPrincipal = Depends(get_current_principal()),
+):
+    """
+    Statements slower than SLOW_QUERY_MS recorded by the worker answering the request, grouped by shape
+    and one by one with their parameters and, for a sample, their execution plan. Requires admin group
+    """
+    _check_admin(current_user)
+    return create_response(data={"shapes": slow_query_log.get_shapes(), "queries": slow_query_log.get_entries()})
@@ -6,7 +6,8 @@ from fastapi_pagination import Params
 import crud
 from exceptions import ContentNoChangeException, IdNotFoundException, NameExistException
 from models.role_model import Role
-from schemas.response_schema import IResponse, IResponsePage, create_response
+from schemas.common_schema import CursorQuery
+from schemas.response_schema import IResponse, IResponseCursorPage, IResponsePage, create_response
 from schemas.role_schema import IRoleCreate, IRoleRead, IRoleUpdate
 
 router = APIRouter()
@@ -19,7 +20,18 @@ async def get_roles(
     """
     Gets a paginated list of roles
     """
-    roles = await crud.role.get_multi_paginated(params=params)
+    roles = await crud.role.get_multi_paginated(params=params, load="read")
+    return create_response(data=roles)
+
+
+@router.get("/list/cursor", response_model=IResponseCursorPage[IRoleRead])
+async def get_roles_cursor(
+    params: CursorQuery = Depends(),
+):
+    """
+    Gets a list of roles page by page, following the next_cursor of the previous page
+    """
+    roles = await crud.role.get_multi_cursor_paginated(params=params, load="read")
     return create_response(data=roles)
 
 
@@ -33,7 +45,7 @@ async def get_role_by_id(
     """
     Gets a role by its id
     """
-    role = await crud.role.get(id=role_id)
+    role = await crud.role.get(id=role_id, load="read")
     if role:
         return create_response(data=role)
     else:
@@ -49,7 +61,7 @@ async def create_role(
     """
     role_current = await crud.role.get_by("name", role.name)
     if not role_current:
-        new_permission = await crud.role.create(obj_in=role)
+        new_permission = await crud.role.create(obj_in=role, load="read")
         return create_response(data=new_permission)
     else:
         raise NameExistException(Role, name=role_current.name)
@@ -74,7 +86,7 @@ async def update_permission(
     if exist_role:
         raise NameExistException(Role, name=role.name)
 
-    updated_role = await crud.role.update(obj_current=current_role, obj_new=role)
+    updated_role = await crud.role.update(obj_current=current_role, obj_new=role, load="read")
     return create_response(data=updated_role)
 
 
@@ -88,5 +100,5 @@ async def delete_role(
     role = await crud.role.get(id=role_id)
     if not role:
         raise IdNotFoundException(Role, role_id)
-    role = await crud.role.delete(id=role_id)
+    role = await crud.role.delete(id=role_id, load="read")
     return create_response(data=role)
@@ -3,23 +3,32 @@ from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Body, Depends, File, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from fastapi_pagination import Params
 
 import crud
-from api.deps import get_current_user, is_valid_user, user_exists
+from api.deps import count_strategy, get_current_user, in_group, is_valid_user, transaction, user_exists
 from exceptions import ContentNoChangeException, IdNotFoundException
 from middlewares.minio import Minio, get_ctx_client
 from models import User
-from schemas.common_schema import FilterQuery
+from models.group_model import GroupEnum
+from schemas.common_schema import CursorQuery, FilterQuery, ICountStrategyEnum, IExportFormatEnum
 from schemas.media_schema import IMediaCreate
-from schemas.response_schema import IResponse, IResponsePage, create_response
+from schemas.response_schema import IResponse, IResponseCursorPage, IResponsePage, create_response
+from schemas.socialaccount_schema import ISocialAccountRead
 from schemas.user_schema import IUserCreate, IUserRead, IUserReadBasic
+from schemas.wallet_schema import IWalletRead
+from utils.export import export_response
 from utils.resize_image import modify_image
 
 router = APIRouter()
 
 
-@router.get("/list", response_model=IResponsePage[IUserReadBasic])
+@router.get(
+    "/list",
+    response_model=IResponsePage[IUserReadBasic],
+    dependencies=[Depends(transaction(deferrable=True)), Depends(count_strategy(ICountStrategyEnum.estimated))],
+)
 async def list_users(
     filters: FilterQuery = Depends(),
     params: Params = Depends(),
@@ -27,13 +36,80 @@ async def list_users(
     """
     Retrieve users. Requires admin or manager role
     """
-    users = await crud.user.get_multi_filtered_paginated(filters=filters, params=params)
+    users = await crud.user.get_multi_filtered_paginated(filters=filters, params=params, load="basic")
     return create_response(data=users)
 
 
+@router.get(
+    "/list/cursor",
+    response_model=IResponseCursorPage[IUserReadBasic],
+    dependencies=[Depends(transaction(deferrable=True))],
+)
+async def list_users_cursor(
+    filters: FilterQuery = Depends(),
+    params: CursorQuery = Depends(),
+):
+    """
+    Retrieve users page by page, following the next_cursor of the previous page
+    """
+    users = await crud.user.get_multi_cursor_paginated(filters=filters, params=params, load="basic")
+    return create_response(data=users)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(transaction(deferrable=True)), Depends(in_group(GroupEnum.admin))],
+)
+async def export_users(
+    filters: FilterQuery = Depends(),
+    format: IExportFormatEnum = IExportFormatEnum.ndjson,
+):
+    """
+    Exports the users matching the filter as NDJSON, CSV or Parquet. Requires admin group
+    """
+    columns = crud.user.get_export_columns(IUserReadBasic)
+    partitions = await crud.user.stream_multi_filtered(columns=columns, filters=filters)
+    return export_response(format, "users", columns, partitions)
+
+
+@router.get(
+    "/wallet/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(transaction(deferrable=True)), Depends(in_group(GroupEnum.admin))],
+)
+async def export_wallets(
+    filters: FilterQuery = Depends(),
+    format: IExportFormatEnum = IExportFormatEnum.ndjson,
+):
+    """
+    Exports the wallets matching the filter as NDJSON, CSV or Parquet. Requires admin group
+    """
+    columns = crud.wallet.get_export_columns(IWalletRead)
+    partitions = await crud.wallet.stream_multi_filtered(columns=columns, filters=filters)
+    return export_response(format, "wallets", columns, partitions)
+
+
+@router.get(
+    "/socialaccount/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(transaction(deferrable=True)), Depends(in_group(GroupEnum.admin))],
+)
+async def export_socialaccounts(
+    filters: FilterQuery = Depends(),
+    format: IExportFormatEnum = IExportFormatEnum.ndjson,
+):
+    """
+    Exports the social accounts matching the filter as NDJSON, CSV or Parquet. Requires admin group
+    """
+    columns = crud.socialaccount.get_export_columns(ISocialAccountRead)
+    partitions = await crud.socialaccount.stream_multi_filtered(columns=columns, filters=filters)
+    return export_response(format, "socialaccounts", columns, partitions)
+
+
 @router.get("/me", response_model=IResponse[IUserRead])
 async def get_my_data(
-    current_user: User = Depends(get_current_user()),
+    current_user: User = Depends(get_current_user(load="read")),
 ):
     """
     Gets my user profile information
@@ -48,7 +124,7 @@ async def get_user_by_id(
     """
     Gets a user by id
     """
-    if user := await crud.user.get(id=user_id):
+    if user := await crud.user.get(id=user_id, load="read"):
         return create_response(data=user)
     else:
         raise IdNotFoundException(User, id=user_id)
@@ -61,7 +137,7 @@ async def create_user(
     """
     Creates a new user
     """
-    user = await crud.user.create(obj_in=new_user)
+    user = await crud.user.create(obj_in=new_user, load="read")
     return create_response(data=user)
 
 
@@ -72,7 +148,7 @@ async def delete_user(
     """
     Deletes a user by his/her id
     """
-    user = await crud.user.delete(id=user.id)
+    user = await crud.user.delete(id=user.id, load="read")
     return create_response(data=user)
 
 
@@ -81,7 +157,7 @@ async def upload_my_image(
     title: Optional[str] = Body(None),
     description: Optional[str] = Body(None),
     image_file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user()),
+    current_user: User = Depends(get_current_user(load="read")),
     minio_client: Minio = Depends(get_ctx_client),
 ):
     """
@@ -101,6 +177,7 @@ async def upload_my_image(
             heigth=image_modified.height,
             width=image_modified.width,
             file_format=image_modified.file_format,
+            load="read",
         )
         return create_response(data=user)
     except Exception as e:
@@ -129,5 +206,5 @@ async def update_user_info(
     ):
         raise ContentNoChangeException()
 
-    updated_user = await crud.user.update(obj_current=current_user_data, obj_new=user)
+    updated_user = await crud.user.update(obj_current=current_user_data, obj_new=user, load="read")
     return create_response(data=updated_user)
@@ -1,17 +1,23 @@
+import asyncio
 import logging
 
 from fastapi import FastAPI
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from fastapi_pagination import add_pagination
+from redis import asyncio as aioredis
 from redis import from_url
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 from api import router
+from core.hashing import password_hasher
 from core.settings import settings
-from middlewares.asql import ContextDatabaseMiddleware
+from core.signatures import signature_verifier
+from middlewares.asql import ContextDatabaseMiddleware, monitor_replicas
 from middlewares.redis import ContextRedisMiddleware
+from middlewares.timing import ServerTimingMiddleware, TimedJSONResponse
+from utils.token_cache import token_cache
 
 # Core Application Instance
 app = FastAPI(
@@ -20,10 +26,11 @@ app = FastAPI(
     docs_url=None,
     redoc_url=None,
     openapi_url=None,
+    default_response_class=TimedJSONResponse,
 )
 
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
-app.add_middleware(ContextDatabaseMiddleware, url=settings.ASYNC_DB_URL)
+app.add_middleware(ContextDatabaseMiddleware, url=settings.ASYNC_DB_URL, replica_urls=settings.DB_REPLICA_URLS)
 app.add_middleware(ContextRedisMiddleware, url=settings.REDIS_URL)
 
 
@@ -37,6 +44,9 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+# Outermost so the measures include the commit, see ServerTimingMiddleware
+app.add_middleware(ServerTimingMiddleware, header=settings.SERVER_TIMING)
+
 
 @app.on_event("startup")
 async def on_startup():
@@ -51,9 +61,29 @@ async def on_startup():
     except Exception:
         raise ConnectionRefusedError(f"Redis server not responding using {redis_client.get_connection_kwargs()}")
     FastAPICache.init(RedisBackend(redis_client), prefix="fastapi-cache")
+    if settings.PWD_HASH_CALIBRATE:
+        async with aioredis.from_url(settings.REDIS_URL) as calibration_client:
+            await password_hasher.load_or_calibrate(
+                calibration_client,
+                settings.PWD_HASH_SCHEME,
+                settings.PWD_HASH_TARGET_MS,
+                settings.PWD_HASH_MIN_ROUNDS,
+            )
+    app.state.token_listener = asyncio.create_task(token_cache.listen(settings.REDIS_URL))
+    app.state.replica_monitor = asyncio.create_task(monitor_replicas()) if settings.DB_REPLICA_URLS else None
     logging.info("startup fastapi")
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.token_listener.cancel()
+    if app.state.replica_monitor:
+        app.state.replica_monitor.cancel()
+    password_hasher.shutdown()
+    signature_verifier.shutdown()
+    logging.info("shutdown fastapi")
+
+
 # Add Apps
 app.include_router(router)
 add_pagination(app)
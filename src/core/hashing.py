@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import statistics
+import time
+from functools import lru_cache
+from typing import Any, Dict
+
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+from redis.asyncio import Redis
+
+from core.settings import settings
+from core.workers import WorkerPool
+
+BCRYPT_MAX_ROUNDS = 16
+# a calibration takes a few hashes, the lock of a worker killed while calibrating expires after this
+CALIBRATION_LOCK_SECONDS = 60
+
+
+def make_context(scheme: str = "bcrypt", **params: Any) -> CryptContext:
+    """
+    Builds the password context. `params` are the calibrated parameters of `scheme`, never below the passlib
+    default cost, stored hashes whose cost is below them are reported by `needs_update`. Stronger hashes are
+    kept so a slower calibration never downgrades them. bcrypt stays accepted so existing hashes still verify
+    after switching to argon2.
+    """
+    options: Dict[str, Any] = {"schemes": [scheme] if scheme == "bcrypt" else [scheme, "bcrypt"], "deprecated": "auto"}
+    if rounds := params.get("rounds"):
+        rounds = max(rounds, get_crypt_handler(scheme).default_rounds)
+        options[f"{scheme}__default_rounds"] = rounds
+        options[f"{scheme}__min_rounds"] = rounds
+    if scheme == "argon2":
+        options["argon2__memory_cost"] = params.get("memory_cost", settings.PWD_ARGON2_MEMORY_KIB)
+        options["argon2__parallelism"] = params.get("parallelism", settings.PWD_ARGON2_PARALLELISM)
+    return CryptContext(**options)
+
+
+pwd_context = make_context(settings.PWD_HASH_SCHEME)
+
+
+@lru_cache(maxsize=4)
+def _context(config: str) -> CryptContext:
+    return CryptContext.from_string(config)
+
+
+def _hash(config: str, password: str) -> str:
+    return _context(config).hash(password)
+
+
+def _verify(config: str, plain_password: str, hashed_password: str) -> bool:
+    return _context(config).verify(plain_password, hashed_password)
+
+
+def _time_hash(context: CryptContext, samples: int = 3) -> float:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash("calibration")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _calibrate(scheme: str, target_ms: int, min_rounds: int) -> Dict[str, Any]:
+    if scheme not in ("bcrypt", "argon2"):
+        raise ValueError(f"Unsupported password hash scheme {scheme}")
+    target = target_ms / 1000
+    # make_context never goes below the passlib default, measure from there
+    min_rounds = max(min_rounds, get_crypt_handler(scheme).default_rounds)
+    elapsed = _time_hash(make_context(scheme, rounds=min_rounds))
+    if scheme == "bcrypt":
+        # each bcrypt round doubles the cost
+        rounds = min_rounds + int(math.floor(math.log2(max(target / elapsed, 1))))
+        return {"rounds": min(rounds, BCRYPT_MAX_ROUNDS)}
+    # the argon2 cost grows linearly with its rounds
+    return {"rounds": max(int(min_rounds * target / elapsed), min_rounds)}
+
+
+class PasswordHasher:
+    """Runs password hashing and verification in a dedicated worker pool."""
+
+    def __init__(self, pool: WorkerPool, context: CryptContext):
+        self.pool = pool
+        self.configure(context)
+
+    def configure(self, context: CryptContext):
+        self.context = context
+        self._config = context.to_string()
+
+    async def calibrate(self, scheme: str, target_ms: int, min_rounds: int) -> Dict[str, Any]:
+        """
+        Measures the hashing cost in a worker and picks the parameters closest to `target_ms` per hash.
+        """
+        params = await self.pool.run(_calibrate, scheme, target_ms, min_rounds)
+        self.configure(make_context(scheme, **params))
+        logging.info(f"Password hashing calibrated to {scheme} {params} for {target_ms}ms")
+        return params
+
+    async def load_or_calibrate(self, redis_client: Redis, scheme: str, target_ms: int, min_rounds: int):
+        """
+        Shares one calibration between workers: the worker holding the lock calibrates while the others wait,
+        before any of them hashes, then every worker uses the published parameters and agrees on which hashes
+        need an update.
+        """
+        key = f"password_hash:{scheme}:{target_ms}"
+        while not (params := await redis_client.get(key)):
+            if await redis_client.set(f"{key}:lock", os.getpid(), ex=CALIBRATION_LOCK_SECONDS, nx=True):
+                try:
+                    calibrated = await self.calibrate(scheme, target_ms, min_rounds)
+                    await redis_client.set(key, json.dumps(calibrated), ex=24 * 3600)
+                finally:
+                    await redis_client.delete(f"{key}:lock")
+                return
+            await asyncio.sleep(0.1)
+        self.configure(make_context(scheme, **json.loads(params)))
+
+    def needs_update(self, hashed_password: str) -> bool:
+        return self.context.needs_update(hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self.pool.run(_hash, self._config, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.pool.run(_verify, self._config, plain_password, hashed_password)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+password_hasher = PasswordHasher(
+    WorkerPool(
+        "password-hashing",
+        max_workers=settings.PWD_HASH_WORKERS,
+        max_queue=settings.PWD_HASH_MAX_QUEUE,
+        timeout=settings.PWD_HASH_TIMEOUT,
+    ),
+    pwd_context,
+)
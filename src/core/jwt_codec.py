@@ -0,0 +1,372 @@
+import base64
+import hashlib
+import hmac
+import time
+from abc import ABC, abstractmethod
+from calendar import timegm
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Type
+
+import orjson
+
+
+class JWTError(Exception):
+    pass
+
+
+class ExpiredSignatureError(JWTError):
+    pass
+
+
+# PEM keys, certificates and OpenSSH public keys, never valid HMAC secrets
+_ASYMMETRIC_PREFIXES = (b"-----BEGIN ", b"ssh-rsa", b"ssh-ed25519", b"ecdsa-sha2-")
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _int_to_b64(value: int, length: Optional[int] = None) -> str:
+    length = length or (value.bit_length() + 7) // 8
+    return _b64encode(value.to_bytes(length, "big")).decode()
+
+
+def _b64_to_int(value: str) -> int:
+    return int.from_bytes(_b64decode(value), "big")
+
+
+class JWTBackend(ABC):
+    """
+    Cryptographic primitives used by `JWTCodec`.
+    Keys are prepared once with the `load_*` methods and the resulting objects are reused on every call.
+    """
+
+    name: str
+    algorithms: Iterable[str]
+
+    @abstractmethod
+    def load_secret(self, secret: str | bytes | Mapping[str, Any], algorithm: str) -> Any:
+        pass
+
+    @abstractmethod
+    def load_private_key(self, pem: str | bytes, algorithm: str) -> Any:
+        pass
+
+    @abstractmethod
+    def load_public_key(self, material: str | bytes | Mapping[str, Any], algorithm: str) -> Any:
+        pass
+
+    @abstractmethod
+    def public_key(self, key: Any) -> Any:
+        pass
+
+    @abstractmethod
+    def public_jwk(self, key: Any, algorithm: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def sign(self, key: Any, algorithm: str, message: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def verify(self, key: Any, algorithm: str, message: bytes, signature: bytes) -> bool:
+        pass
+
+
+class JoseBackend(JWTBackend):
+    name = "jose"
+    algorithms = ("HS256", "HS384", "HS512", "RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+
+    def _construct(self, material: Any, algorithm: str) -> Any:
+        from jose import jwk
+        from jose.exceptions import JOSEError
+
+        if algorithm not in self.algorithms:
+            raise JWTError(f"Algorithm {algorithm} is not supported by the {self.name} backend")
+        try:
+            return jwk.construct(material, algorithm)
+        except JOSEError as e:
+            raise JWTError(str(e))
+
+    def load_secret(self, secret: str | bytes | Mapping[str, Any], algorithm: str) -> Any:
+        return self._construct(secret, algorithm)
+
+    def load_private_key(self, pem: str | bytes, algorithm: str) -> Any:
+        return self._construct(pem, algorithm)
+
+    def load_public_key(self, material: str | bytes | Mapping[str, Any], algorithm: str) -> Any:
+        return self._construct(material, algorithm)
+
+    def public_key(self, key: Any) -> Any:
+        return key.public_key()
+
+    def public_jwk(self, key: Any, algorithm: str) -> Dict[str, Any]:
+        return {k: v.decode() if isinstance(v, bytes) else v for k, v in key.to_dict().items()}
+
+    def sign(self, key: Any, algorithm: str, message: bytes) -> bytes:
+        return key.sign(message)
+
+    def verify(self, key: Any, algorithm: str, message: bytes, signature: bytes) -> bool:
+        return key.verify(message, signature)
+
+
+class CryptographyBackend(JWTBackend):
+    name = "cryptography"
+    algorithms = ("HS256", "HS384", "HS512", "RS256", "RS384", "RS512", "ES256", "ES384", "ES512", "EdDSA")
+
+    _HMAC_HASHES = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+    _CURVES = {"ES256": ("P-256", 32), "ES384": ("P-384", 48), "ES512": ("P-521", 66)}
+    _CURVE_NAMES = {"ES256": "secp256r1", "ES384": "secp384r1", "ES512": "secp521r1"}
+
+    def __init__(self):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec, padding
+
+        self._hashes = {"256": hashes.SHA256(), "384": hashes.SHA384(), "512": hashes.SHA512()}
+        self._padding = padding.PKCS1v15()
+        self._ec = ec
+
+    def _check(self, algorithm: str):
+        if algorithm not in self.algorithms:
+            raise JWTError(f"Algorithm {algorithm} is not supported by the {self.name} backend")
+
+    def load_secret(self, secret: str | bytes | Mapping[str, Any], algorithm: str) -> Any:
+        self._check(algorithm)
+        if not algorithm.startswith("HS"):
+            raise JWTError(f"Algorithm {algorithm} does not use a shared secret")
+        if isinstance(secret, Mapping):
+            if secret.get("kty") != "oct":
+                raise JWTError("An HMAC key must be a JWK of type oct")
+            return _b64decode(secret["k"])
+        secret = secret.encode() if isinstance(secret, str) else secret
+        # a public key used as a secret lets anyone holding it sign tokens (algorithm confusion)
+        if secret.lstrip().startswith(_ASYMMETRIC_PREFIXES):
+            raise JWTError(
+                "The specified key is an asymmetric key or x509 certificate and should not be used as an HMAC secret."
+            )
+        return secret
+
+    def load_private_key(self, pem: str | bytes, algorithm: str) -> Any:
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        self._check(algorithm)
+        if algorithm.startswith("HS"):
+            return self.load_secret(pem, algorithm)
+        try:
+            key = load_pem_private_key(pem.encode() if isinstance(pem, str) else pem, password=None)
+        except (ValueError, TypeError) as e:
+            raise JWTError(f"Invalid private key: {e}")
+        self._check_key(key, algorithm)
+        return key
+
+    def load_public_key(self, material: str | bytes | Mapping[str, Any], algorithm: str) -> Any:
+        self._check(algorithm)
+        if algorithm.startswith("HS"):
+            return self.load_secret(material, algorithm)
+        try:
+            key = self._load_public_key(material)
+        except (ValueError, TypeError, KeyError) as e:
+            raise JWTError(f"Invalid public key: {e}")
+        self._check_key(key, algorithm)
+        return key
+
+    def _load_public_key(self, material: str | bytes | Mapping[str, Any]) -> Any:
+        from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+        if not isinstance(material, Mapping):
+            return load_pem_public_key(material.encode() if isinstance(material, str) else material)
+        if material["kty"] == "RSA":
+            return rsa.RSAPublicNumbers(_b64_to_int(material["e"]), _b64_to_int(material["n"])).public_key()
+        if material["kty"] == "EC":
+            curve = {"P-256": self._ec.SECP256R1, "P-384": self._ec.SECP384R1, "P-521": self._ec.SECP521R1}
+            numbers = self._ec.EllipticCurvePublicNumbers(
+                _b64_to_int(material["x"]), _b64_to_int(material["y"]), curve[material["crv"]]()
+            )
+            return numbers.public_key()
+        if material["kty"] == "OKP" and material.get("crv") == "Ed25519":
+            return ed25519.Ed25519PublicKey.from_public_bytes(_b64decode(material["x"]))
+        raise JWTError(f"Unsupported JWK key type {material['kty']}")
+
+    def _key_matches(self, key: Any, algorithm: str) -> bool:
+        from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+        if algorithm.startswith("HS"):
+            return isinstance(key, bytes)
+        if algorithm.startswith("RS"):
+            return isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey))
+        if algorithm.startswith("ES"):
+            if not isinstance(key, (self._ec.EllipticCurvePrivateKey, self._ec.EllipticCurvePublicKey)):
+                return False
+            return key.curve.name == self._CURVE_NAMES[algorithm]
+        return isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey))
+
+    def _check_key(self, key: Any, algorithm: str):
+        if not self._key_matches(key, algorithm):
+            raise JWTError(f"The key is not a valid {algorithm} key")
+
+    def public_key(self, key: Any) -> Any:
+        return key.public_key() if hasattr(key, "public_key") else key
+
+    def public_jwk(self, key: Any, algorithm: str) -> Dict[str, Any]:
+        from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+        if algorithm.startswith("RS"):
+            numbers = key.public_numbers()
+            return {"kty": "RSA", "alg": algorithm, "n": _int_to_b64(numbers.n), "e": _int_to_b64(numbers.e)}
+        if algorithm.startswith("ES"):
+            crv, size = self._CURVES[algorithm]
+            numbers = key.public_numbers()
+            return {
+                "kty": "EC",
+                "alg": algorithm,
+                "crv": crv,
+                "x": _int_to_b64(numbers.x, size),
+                "y": _int_to_b64(numbers.y, size),
+            }
+        if algorithm == "EdDSA":
+            x = key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+            return {"kty": "OKP", "alg": algorithm, "crv": "Ed25519", "x": _b64encode(x).decode()}
+        raise JWTError(f"Algorithm {algorithm} has no public key")
+
+    def sign(self, key: Any, algorithm: str, message: bytes) -> bytes:
+        from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+        if algorithm.startswith("HS"):
+            return hmac.new(key, message, self._HMAC_HASHES[algorithm]).digest()
+        if algorithm.startswith("RS"):
+            return key.sign(message, self._padding, self._hashes[algorithm[2:]])
+        if algorithm.startswith("ES"):
+            r, s = decode_dss_signature(key.sign(message, self._ec.ECDSA(self._hashes[algorithm[2:]])))
+            size = self._CURVES[algorithm][1]
+            return r.to_bytes(size, "big") + s.to_bytes(size, "big")
+        return key.sign(message)
+
+    def verify(self, key: Any, algorithm: str, message: bytes, signature: bytes) -> bool:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+        # a key prepared for another algorithm family is a rejected token, not a server error
+        self._check_key(key, algorithm)
+        if algorithm.startswith("HS"):
+            return hmac.compare_digest(hmac.new(key, message, self._HMAC_HASHES[algorithm]).digest(), signature)
+        try:
+            if algorithm.startswith("RS"):
+                key.verify(signature, message, self._padding, self._hashes[algorithm[2:]])
+            elif algorithm.startswith("ES"):
+                size = self._CURVES[algorithm][1]
+                if len(signature) != 2 * size:
+                    return False
+                r, s = int.from_bytes(signature[:size], "big"), int.from_bytes(signature[size:], "big")
+                key.verify(encode_dss_signature(r, s), message, self._ec.ECDSA(self._hashes[algorithm[2:]]))
+            else:
+                key.verify(signature, message)
+        except InvalidSignature:
+            return False
+        return True
+
+
+BACKENDS: Dict[str, Type[JWTBackend]] = {
+    JoseBackend.name: JoseBackend,
+    CryptographyBackend.name: CryptographyBackend,
+}
+
+
+def get_backend(name: str) -> JWTBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JWT backend {name}, expected one of {list(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class JWTCodec:
+    """
+    Encodes and decodes compact JWS tokens with prepared keys.
+    **Parameters**
+    * `backend`: Cryptographic backend
+    * `algorithms`: Algorithms accepted when decoding, anything else is rejected before the key lookup
+    """
+
+    def __init__(self, backend: JWTBackend, algorithms: Iterable[str]):
+        self.backend = backend
+        self.algorithms = frozenset(algorithms)
+
+    def encode(self, claims: Dict[str, Any], key: Any, algorithm: str, kid: Optional[str] = None) -> str:
+        header = {"alg": algorithm, "typ": "JWT"}
+        if kid is not None:
+            header["kid"] = kid
+        claims = {
+            k: timegm(v.utctimetuple()) if isinstance(v, datetime) and k in ("exp", "iat", "nbf") else v
+            for k, v in claims.items()
+        }
+        signing_input = _b64encode(orjson.dumps(header)) + b"." + _b64encode(orjson.dumps(claims))
+        signature = self.backend.sign(key, algorithm, signing_input)
+        return (signing_input + b"." + _b64encode(signature)).decode()
+
+    def decode(
+        self,
+        token: str,
+        key_lookup: Callable[[Dict[str, Any]], Any],
+        options: Optional[Mapping[str, Any]] = None,
+        audience: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Verifies `token` and returns its claims. `key_lookup` receives the parsed header and returns the prepared
+        key to verify with, or None when no key matches.
+        """
+        try:
+            signing_input, _, crypto_segment = token.rpartition(".")
+            header_segment, _, payload_segment = signing_input.partition(".")
+            header = orjson.loads(_b64decode(header_segment))
+            signature = _b64decode(crypto_segment)
+        except (ValueError, TypeError):
+            raise JWTError("Error decoding token headers.")
+        if not isinstance(header, dict):
+            raise JWTError("Invalid header string: must be a json object")
+
+        algorithm = header.get("alg")
+        if algorithm not in self.algorithms:
+            raise JWTError("The specified alg value is not allowed")
+        key = key_lookup(header)
+        if key is None:
+            raise JWTError(f"Unknown key id {header.get('kid')}")
+        if not self.backend.verify(key, algorithm, signing_input.encode(), signature):
+            raise JWTError("Signature verification failed.")
+
+        try:
+            claims = orjson.loads(_b64decode(payload_segment))
+        except ValueError:
+            raise JWTError("Invalid payload string")
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload string: must be a json object")
+        _validate_claims(claims, options or {}, audience)
+        return claims
+
+
+def _validate_claims(claims: Dict[str, Any], options: Mapping[str, Any], audience: Optional[str]):
+    leeway = options.get("leeway", 0)
+    now = time.time()
+
+    if options.get("verify_exp", True) and "exp" in claims:
+        if not isinstance(claims["exp"], (int, float)):
+            raise JWTError("Expiration Time claim (exp) must be an integer.")
+        if claims["exp"] < now - leeway:
+            raise ExpiredSignatureError("Signature has expired.")
+
+    if options.get("verify_nbf", True) and "nbf" in claims:
+        if not isinstance(claims["nbf"], (int, float)):
+            raise JWTError("Not Before claim (nbf) must be an integer.")
+        if claims["nbf"] > now + leeway:
+            raise JWTError("The token is not yet valid (nbf)")
+
+    if options.get("verify_aud", True):
+        if "aud" not in claims:
+            if audience is not None:
+                raise JWTError("Invalid audience")
+        else:
+            audiences = claims["aud"] if isinstance(claims["aud"], list) else [claims["aud"]]
+            if audience is None or audience not in audiences:
+                raise JWTError("Invalid audience")
@@ -0,0 +1,93 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from core.jwt_codec import JWTCodec, get_backend
+from core.settings import settings
+
+_PRIVATE_SUFFIX = ".pem"
+_PUBLIC_SUFFIX = ".pub.pem"
+
+
+class KeyRing:
+    """
+    JWT signing keys indexed by `kid`.
+
+    With an HMAC algorithm the ring holds the shared `SECRET_KEY` and publishes no keys.
+    With an asymmetric algorithm, keys are read from `keys_dir`:
+    * `{kid}.pem`: private key, can sign and verify
+    * `{kid}.pub.pem`: public key of a retired key, only verifies tokens issued before the rotation
+
+    Tokens are signed with `active_kid`, or with the last private key in name order.
+    Keys are parsed once by the codec backend and reused for every token.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        secret: Optional[str] = None,
+        keys_dir: Optional[str] = None,
+        active_kid: Optional[str] = None,
+        backend: str = "jose",
+    ):
+        self.algorithm = algorithm
+        self.symmetric = algorithm.startswith("HS")
+        self.codec = JWTCodec(get_backend(backend), [algorithm])
+        self.active_kid: Optional[str] = None
+        self._signing_keys: Dict[Optional[str], Any] = {}
+        self._verifying_keys: Dict[Optional[str], Any] = {}
+
+        if self.symmetric:
+            key = self.codec.backend.load_secret(secret, algorithm)
+            self._signing_keys[None] = key
+            self._verifying_keys[None] = key
+            return
+
+        if not keys_dir:
+            raise ValueError(f"JWT_KEYS_DIR is required with algorithm {algorithm}")
+
+        for file_name in sorted(os.listdir(keys_dir)):
+            with open(os.path.join(keys_dir, file_name)) as f:
+                pem = f.read()
+            if file_name.endswith(_PUBLIC_SUFFIX):
+                kid = file_name.removesuffix(_PUBLIC_SUFFIX)
+                self._verifying_keys[kid] = self.codec.backend.load_public_key(pem, algorithm)
+            elif file_name.endswith(_PRIVATE_SUFFIX):
+                kid = file_name.removesuffix(_PRIVATE_SUFFIX)
+                key = self.codec.backend.load_private_key(pem, algorithm)
+                self._signing_keys[kid] = key
+                self._verifying_keys[kid] = self.codec.backend.public_key(key)
+                self.active_kid = kid
+
+        if active_kid is not None:
+            self.active_kid = active_kid
+        if self.active_kid not in self._signing_keys:
+            raise ValueError(f"No private key {self.active_kid} found in {keys_dir}")
+        logging.info(f"JWT key ring loaded, signing with {self.active_kid}, {len(self._verifying_keys)} keys")
+
+    def _lookup(self, header: Dict[str, Any]) -> Any:
+        return self._verifying_keys.get(header.get("kid"))
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        return self.codec.encode(claims, self._signing_keys[self.active_kid], self.algorithm, kid=self.active_kid)
+
+    def decode(self, token: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self.codec.decode(token, self._lookup, options=options)
+
+    def jwks(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self.symmetric:
+            return {"keys": []}
+        keys = []
+        for kid, key in self._verifying_keys.items():
+            public_jwk = self.codec.backend.public_jwk(key, self.algorithm)
+            keys.append({**public_jwk, "alg": self.algorithm, "kid": kid, "use": "sig"})
+        return {"keys": keys}
+
+
+keyring = KeyRing(
+    settings.ALGORITHM,
+    secret=settings.SECRET_KEY,
+    keys_dir=settings.JWT_KEYS_DIR,
+    active_kid=settings.JWT_ACTIVE_KID,
+    backend=settings.JWT_BACKEND,
+)
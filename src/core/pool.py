@@ -0,0 +1,55 @@
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    overflow_checkouts: int = 0
+    max_overflow_in_use: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Connection pool recording how long checkouts wait for a connection, how often they need an
+    overflow connection and how many of them time out.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.stats.wait_seconds_total += waited
+            self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, waited)
+
+        self.stats.checkouts += 1
+        if (overflow := self.overflow()) > 0:
+            self.stats.overflow_checkouts += 1
+            self.stats.max_overflow_in_use = max(self.stats.max_overflow_in_use, overflow)
+        return connection
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "timeout": self.timeout(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            **asdict(self.stats),
+        }
@@ -1,23 +1,23 @@
-import string
 from datetime import datetime, timedelta
-from random import SystemRandom
-from typing import Any, Dict, Literal, Mapping
-from uuid import UUID
+from typing import Any, Dict, List, Literal, Mapping, Tuple
 
 from cryptography.fernet import Fernet
 from fastapi import HTTPException, Request, status
 from fastapi.security import HTTPBearer
 from fastapi.security.utils import get_authorization_scheme_param
-from jose import exceptions, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from redis import Redis
+from uuid6 import uuid7
 
+from core.hashing import password_hasher
+from core.jwt_codec import JWTCodec, JWTError, get_backend
+from core.keyring import keyring
 from core.settings import settings
-from utils.nonce import set_nonce
-from utils.token import TokenType, delete_tokens, get_tokens, set_token
+from core.signatures import SignatureError, signature_verifier
+from core.workers import WorkerPoolFullError, WorkerPoolTimeoutError
+from utils.token import TokenType, check_token, delete_tokens, set_token
+from utils.token_cache import token_cache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 fernet = Fernet(str.encode(settings.ENCRYPT_KEY))
 
 
@@ -28,13 +28,13 @@ class Token(BaseModel):
 
 
 def jwt_encode(claims: Dict[str, Any]) -> str:
-    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return keyring.encode(claims)
 
 
 def jwt_decode(token: str) -> Dict[str, Any]:
     try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=settings.ALGORITHM)
-    except jwt.JWTError as e:
+        return keyring.decode(token)
+    except JWTError as e:
         raise HTTPException(
             status_code=403,
             detail=str(e),
@@ -47,10 +47,12 @@ async def create_token(
 ) -> Token:
     expires_in = timedelta(minutes=settings.JWT_EXPIRE_MINUTES)
     expire_date = datetime.utcnow() + expires_in
-    claims = {"exp": expire_date, "sub": str(user_id)}
+    jti = uuid7().hex
+    claims = {"exp": expire_date, "sub": str(user_id), "jti": jti}
     encoded_jwt = jwt_encode(claims)
     await set_token(
         user_id,
+        jti,
         encoded_jwt,
         TokenType.JWT,
         expires_in,
@@ -67,17 +69,9 @@ async def refresh_token(
     token: str,
     redis_client: Redis | None = None,
 ) -> Token:
-    try:
-        payload = jwt_decode(token)
-    except jwt.JWTError as e:
-        raise HTTPException(
-            status_code=403,
-            detail=str(e),
-        )
-
+    payload = jwt_decode(token)
     user_id = payload["sub"]
-    valid_tokens = await get_tokens(user_id, TokenType.JWT, redis_client)
-    if valid_tokens and token not in valid_tokens:
+    if not await check_token(user_id, payload.get("jti"), token, TokenType.JWT, redis_client):
         raise HTTPException(status_code=403, detail="Invalid Token")
 
     new_token = await create_token(user_id, redis_client)
@@ -91,12 +85,39 @@ async def revoke_token(
     await delete_tokens(user_id, TokenType.JWT, redis_client)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except (WorkerPoolFullError, WorkerPoolTimeoutError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except (WorkerPoolFullError, WorkerPoolTimeoutError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
+
+
+async def verify_siwe_message(message: str, signature: str, nonce: str | None) -> Tuple[str, int]:
+    try:
+        return await signature_verifier.verify_siwe(message, signature, nonce)
+    except SignatureError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+    except (WorkerPoolFullError, WorkerPoolTimeoutError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
 
 
 def get_data_encrypt(data) -> str:
@@ -108,20 +129,23 @@ def get_content(variable: str) -> str:
     return fernet.decrypt(variable.encode()).decode()
 
 
-async def create_nonce(session_id: UUID, redis_client: Redis | None = None) -> str:
-    expires = timedelta(minutes=5)
-    letters = string.ascii_uppercase + string.ascii_lowercase + string.digits
-    nonce = "".join(SystemRandom().choices(letters, k=12))
-    await set_nonce(session_id, nonce, expires, redis_client)
-    return nonce
-
-
 class TrustedJWSBearer(HTTPBearer):
-    def __init__(self, key: str | bytes | Mapping[str, Any], options: Mapping[str, Any] | None = None, **kwargs):
-        self.key = key
+    def __init__(
+        self,
+        key: str | bytes | Mapping[str, Any],
+        algorithms: List[str] = ["RS256"],
+        options: Mapping[str, Any] | None = None,
+        backend: str = settings.JWT_BACKEND,
+        **kwargs,
+    ):
+        self.codec = JWTCodec(get_backend(backend), algorithms)
+        self.keys = {algorithm: self.codec.backend.load_public_key(key, algorithm) for algorithm in algorithms}
         self.options = options
         super().__init__(**kwargs)
 
+    def _lookup(self, header: Dict[str, Any]) -> Any:
+        return self.keys.get(header["alg"])
+
     def __call__(self, request: Request) -> Dict[str, Any]:
         authorization = request.headers.get("Authorization")
         scheme, param = get_authorization_scheme_param(authorization)
@@ -132,11 +156,9 @@ class TrustedJWSBearer(HTTPBearer):
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        algorithm = jwt.get_unverified_header(param).get("alg")
-
         try:
-            jwt_payload = jwt.decode(param, self.key, algorithms=algorithm, options=self.options)
-        except exceptions.JWTError as e:
+            jwt_payload = self.codec.decode(param, self._lookup, options=self.options)
+        except JWTError as e:
             raise HTTPException(
                 status_code=403,
                 detail=str(e),
@@ -150,14 +172,17 @@ class JWSBearer(HTTPBearer):
     async def __call__(self, request: Request) -> Dict[str, Any]:
         auth = await super().__call__(request)
         token = auth.credentials
+        if jwt_payload := token_cache.get(token):
+            return jwt_payload
+
+        generation = token_cache.generation
         jwt_payload = jwt_decode(auth.credentials)
-        user_id = jwt_payload["sub"]
-        valid_tokens = await get_tokens(user_id, TokenType.JWT)
-        if not valid_tokens or token not in valid_tokens:
+        if not await check_token(jwt_payload.get("sub"), jwt_payload.get("jti"), token, TokenType.JWT):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalide token",
             )
+        token_cache.set(token, jwt_payload, generation)
         return jwt_payload
 
 
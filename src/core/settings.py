@@ -7,10 +7,34 @@ class Settings(BaseSettings):
     API_VERSION: str = "0.0.1"
     API_TITLE: str = "oniverse-api"
     JWT_EXPIRE_MINUTES: int = 60 * 1  # 1 hour
-    WEB_CONCURRENCY = 9
-    DB_POOL_SIZE = 83
-    POOL_SIZE = max(DB_POOL_SIZE // WEB_CONCURRENCY, 5)
-    MAX_OVERFLOW = 64
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: int = 60
+    MAX_SESSIONS_PER_USER: int = 20
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 60 * 60
+    PRINCIPAL_CACHE_LOCAL_TTL: int = 5
+    WORKERS: int = 1
+    # connections available to this deployment on each database server, shared by all workers
+    DB_POOL_SIZE: int = 80
+    DB_POOL_OVERFLOW_RATIO: float = 0.25
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_PGBOUNCER: bool = False
+    POOL_SIZE: Optional[int]
+    MAX_OVERFLOW: Optional[int]
+
+    @validator("MAX_OVERFLOW", pre=True, always=True)
+    def assemble_max_overflow(cls, v: Optional[int], values: Dict[str, Any]) -> int:
+        if v is not None:
+            return v
+        per_worker = max(values.get("DB_POOL_SIZE") // values.get("WORKERS"), 1)
+        return int(per_worker * values.get("DB_POOL_OVERFLOW_RATIO"))
+
+    @validator("POOL_SIZE", pre=True, always=True)
+    def assemble_pool_size(cls, v: Optional[int], values: Dict[str, Any]) -> int:
+        if v is not None:
+            return v
+        per_worker = max(values.get("DB_POOL_SIZE") // values.get("WORKERS"), 1)
+        return max(per_worker - int(per_worker * values.get("DB_POOL_OVERFLOW_RATIO")), 1)
 
     DB_USER: str = "data"
     DB_PASSWORD: str = "data"
@@ -20,6 +44,26 @@ class Settings(BaseSettings):
     DB_ECHO: bool = False
     DB_URL: Optional[str]
     ASYNC_DB_URL: Optional[str]
+    DB_REPLICA_URLS: Union[List[str], str] = []
+    DB_REPLICA_MAX_LAG_SECONDS: float = 5.0
+    DB_REPLICA_LAG_CHECK_SECONDS: float = 2.0
+    SERVER_TIMING: bool = True
+    # statements a route may run before it is logged, routes override it with the `statement_budget` dependency
+    SQL_STATEMENT_BUDGET: int = 20
+    SQL_REPEATED_STATEMENT_THRESHOLD: int = 5
+    SLOW_QUERY_MS: int = 200
+    SLOW_QUERY_LOG_SIZE: int = 200
+    SLOW_QUERY_EXPLAIN_RATE: float = 0.1
+    SLOW_QUERY_EXPLAIN_INTERVAL: int = 10 * 60
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS: int = 30 * 1000
+    # total of paginated listings: exact, estimated, cached or none, routes override it with `count_strategy`
+    PAGINATION_COUNT_STRATEGY: str = "exact"
+    # estimates under this number of rows are replaced by an exact count
+    PAGINATION_EXACT_COUNT_BELOW: int = 1000
+    PAGINATION_COUNT_CACHE_TTL: int = 60
+    PAGINATION_COUNT_CACHE_SIZE: int = 1000
+    # rows fetched from the server-side cursor of an export at a time, and encoded per chunk of the response
+    EXPORT_PARTITION_SIZE: int = 1000
 
     @validator("ASYNC_DB_URL", pre=True)
     def assemble_async_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
@@ -47,6 +91,12 @@ class Settings(BaseSettings):
             path=f"/{values.get('DB_NAME') or ''}",
         )
 
+    @validator("DB_REPLICA_URLS", pre=True)
+    def assemble_replica_urls(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str):
+            return [url.strip() for url in v.split(",") if url.strip()]
+        return v
+
     FIRST_SUPERUSER_EMAIL: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
@@ -77,6 +127,37 @@ class Settings(BaseSettings):
     ENCRYPT_KEY: str = "q+Y0dzUKGhfDDpAYouIUqLsY/NBIQJ2NMKFWeqjxsk8="
     BACKEND_CORS_ORIGINS: Union[List[str], List[AnyHttpUrl]] = ["*"]
     ALGORITHM = "HS256"
+    JWT_KEYS_DIR: Optional[str] = None
+    JWT_ACTIVE_KID: Optional[str] = None
+    JWT_BACKEND: str = "jose"
+
+    PWD_HASH_WORKERS: int = 2
+    PWD_HASH_MAX_QUEUE: int = 64
+    PWD_HASH_TIMEOUT: float = 5.0
+    PWD_HASH_SCHEME: str = "bcrypt"
+    PWD_HASH_CALIBRATE: bool = True
+    PWD_HASH_TARGET_MS: int = 250
+    PWD_HASH_MIN_ROUNDS: int = 12
+    PWD_ARGON2_MEMORY_KIB: int = 65536
+    PWD_ARGON2_PARALLELISM: int = 1
+
+    SIWE_WORKERS: int = 1
+    SIWE_MAX_QUEUE: int = 64
+    SIWE_TIMEOUT: float = 5.0
+    SIWE_NONCE_EXPIRE_SECONDS: int = 5 * 60
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_WINDOW_SECONDS: int = 60
+    RATE_LIMIT_IP_TIMES: int = 30
+    RATE_LIMIT_ACCOUNT_TIMES: int = 5
+    # addresses or networks of the reverse proxies and load balancers whose X-Forwarded-For header is trusted
+    RATE_LIMIT_TRUSTED_PROXIES: Union[List[str], str] = []
+
+    @validator("RATE_LIMIT_TRUSTED_PROXIES", pre=True)
+    def assemble_trusted_proxies(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str):
+            return [proxy.strip() for proxy in v.split(",") if proxy.strip()]
+        return v
 
     GOOGLE_CLIENT_ID: str = ""
     GOOGLE_CLIENT_SECRET: str = ""
@@ -0,0 +1,52 @@
+from typing import Optional, Tuple
+
+from eth_keys.exceptions import BadSignature
+from siwe import SiweMessage, VerificationError
+
+from core.settings import settings
+from core.workers import WorkerPool
+
+
+class SignatureError(Exception):
+    """Exception raised when a signed message is malformed or its signature does not match."""
+
+
+def _verify_siwe(message: str, signature: str, nonce: Optional[str]) -> Tuple[str, int]:
+    try:
+        siwe_message = SiweMessage(message=message)
+    except ValueError:
+        raise SignatureError("Invalid message")
+    try:
+        siwe_message.verify(signature, nonce=nonce)
+    except BadSignature:
+        raise SignatureError("InvalidSignature")
+    except VerificationError as e:
+        # siwe exceptions carry no message, keep the class name for the client
+        raise SignatureError(str(e) or type(e).__name__)
+    return siwe_message.address, siwe_message.chain_id
+
+
+class SignatureVerifier:
+    """Runs signature recovery in a dedicated worker pool."""
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+
+    async def verify_siwe(self, message: str, signature: str, nonce: Optional[str]) -> Tuple[str, int]:
+        """
+        Verifies a Sign-In with Ethereum message, returns the signing address and the chain id.
+        """
+        return await self.pool.run(_verify_siwe, message, signature, nonce)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+signature_verifier = SignatureVerifier(
+    WorkerPool(
+        "signature-verification",
+        max_workers=settings.SIWE_WORKERS,
+        max_queue=settings.SIWE_MAX_QUEUE,
+        timeout=settings.SIWE_TIMEOUT,
+    )
+)
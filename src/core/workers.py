@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class WorkerPoolFullError(Exception):
+    """Exception raised when a job is submitted while the pool queue is already full."""
+
+    def __init__(self, name: str, max_queue: int):
+        super().__init__(f"Worker pool {name} is busy ({max_queue} jobs pending), retry later")
+
+
+class WorkerPoolTimeoutError(Exception):
+    """Exception raised when a job does not complete within the pool timeout."""
+
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"Worker pool {name} did not answer within {timeout}s")
+
+
+@dataclass
+class WorkerPoolStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    timeouts: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    total_seconds: float = 0.0
+
+
+class WorkerPool:
+    """
+    Bounded process pool used to keep CPU bound work off the event loop.
+    **Parameters**
+    * `name`: Name used in logs and errors
+    * `max_workers`: Number of worker processes
+    * `max_queue`: Maximum number of jobs pending or running, extra jobs are rejected
+    * `timeout`: Maximum time in seconds a job can wait and run
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, timeout: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.stats = WorkerPoolStats()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.stats.in_flight >= self.max_queue:
+            self.stats.rejected += 1
+            raise WorkerPoolFullError(self.name, self.max_queue)
+
+        loop = asyncio.get_running_loop()
+        self.stats.submitted += 1
+        self.stats.in_flight += 1
+        self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+        start = time.perf_counter()
+        try:
+            future = loop.run_in_executor(self._get_executor(), fn, *args)
+            result = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            raise WorkerPoolTimeoutError(self.name, self.timeout)
+        except BrokenProcessPool:
+            logging.error(f"Worker pool {self.name} is broken, restarting it")
+            self.stats.failed += 1
+            self.shutdown()
+            raise
+        except Exception:
+            self.stats.failed += 1
+            raise
+        finally:
+            self.stats.in_flight -= 1
+            self.stats.total_seconds += time.perf_counter() - start
+
+        self.stats.completed += 1
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "max_workers": self.max_workers, "max_queue": self.max_queue, **asdict(self.stats)}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,21 +1,47 @@
 import logging
 from datetime import datetime
-from typing import Any, Dict, Generic, List, Literal, Optional, Type, TypeVar, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 from uuid import UUID
 
+import asyncpg
 from fastapi import HTTPException, status
-from fastapi.encoders import jsonable_encoder
-from fastapi_pagination import Page, Params
-from fastapi_pagination.ext.async_sqlalchemy import paginate
-from pydantic import BaseModel
-from sqlalchemy import exc
+from fastapi_pagination import Params
+from fastapi_pagination.ext.utils import unwrap_scalars
+from pydantic import BaseModel, parse_obj_as
+from sqlalchemy import Column, any_, bindparam, delete, exc, insert, inspect, literal, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.elements import ColumnElement
 from sqlalchemy.sql.expression import ColumnCollection
 from sqlmodel import ARRAY, SQLModel, Unicode, and_, func, or_, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.sql.expression import Select
 
-from middlewares.asql import get_ctx_session
-from schemas.common_schema import FilterQuery, GroupQuery, IOrderEnum
+from core.settings import settings
+from exceptions.common_exception import IdNotFoundException, StaleDataException
+from middlewares.asql import get_ctx_read_session, get_ctx_session
+from schemas.common_schema import CursorQuery, FilterQuery, GroupQuery, ICountStrategyEnum, IOrderEnum
+from schemas.response_schema import ICursorPage, IPage
+from utils.count import count_rows, get_ctx_count_strategy
+from utils.cursor import decode_cursor, encode_cursor
+from utils.load_options import schema_load_options
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -23,42 +49,120 @@ UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 SchemaType = TypeVar("SchemaType", bound=BaseModel)
 T = TypeVar("T", bound=SQLModel)
 
+# columns an update never copies from the new values: the key, the timestamps and the version
+_WRITE_ONCE_COLUMNS = {"id", "created_at", "updated_at", "version"}
+
+
+def _python_type(column: ColumnElement) -> Type[Any]:
+    # sqlmodel's AutoString and GUID types don't declare one, their values travel as strings
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return str
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], load_profiles: Optional[Dict[str, Type[BaseModel]]] = None):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
+        Listings and counts read from a replica when one is configured, see `get_ctx_read_session`.
+        `get`, `get_by` and `get_one` stay on the primary as their results are usually modified.
+        Relationships are not loaded unless a method is called with `load`, the name of a load profile.
         **Parameters**
         * `model`: A SQLModel model class
-        * `schema`: A Pydantic model (schema) class
+        * `load_profiles`: Response schemas by profile name, a profile loads the relationships its schema reads
         """
         self.model = model
+        self.load_profiles = load_profiles or {}
+        self._load_options: Dict[str, List[Any]] = {}
+        self._statements: Dict[Tuple[str, Optional[str]], Select] = {}
+
+    def get_load_options(self, load: Optional[str] = None) -> List[Any]:
+        """Loader options of the `load` profile, derived from its schema on first use."""
+        if load is None:
+            return []
+        if load not in self._load_options:
+            if load not in self.load_profiles:
+                raise ValueError(f"Unknown load profile {load} for {self.model.__name__}")
+            self._load_options[load] = schema_load_options(self.model, self.load_profiles[load])
+        return self._load_options[load]
+
+    def _get_by_statement(self, attr: str, load: Optional[str] = None) -> Select:
+        """
+        Statement selecting the model by `attr`, built once per attribute and load profile. Reusing the same
+        statement object spares building it and computing its compiled cache key on every call.
+        """
+        if (attr, load) not in self._statements:
+            query = select(self.model).where(getattr(self.model, attr) == bindparam("value"))
+            self._statements[(attr, load)] = query.options(*self.get_load_options(load))
+        return self._statements[(attr, load)]
 
-    async def get(self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None) -> Optional[ModelType]:
+    def _get_by_ids_statement(self, load: Optional[str] = None) -> Select:
+        """
+        Statement selecting the models whose id is in the `ids` array. Unlike IN, `= ANY(:ids)` renders
+        the same SQL for any number of ids, the server keeps a single prepared statement for it.
+        """
+        if ("id:any", load) not in self._statements:
+            ids = bindparam("ids", type_=ARRAY(self.model.id.type))
+            query = select(self.model).where(self.model.id == any_(ids))
+            self._statements[("id:any", load)] = query.options(*self.get_load_options(load))
+        return self._statements[("id:any", load)]
+
+    async def get(
+        self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> Optional[ModelType]:
         db_session = db_session or get_ctx_session()
-        query = select(self.model).where(self.model.id == id)
-        response = await db_session.execute(query)
+        response = await db_session.execute(self._get_by_statement("id", load), {"value": id})
         return response.scalar_one_or_none()
 
-    async def get_by(self, attr: str, value: Any, db_session: Optional[AsyncSession] = None) -> Optional[ModelType]:
+    async def get_by(
+        self, attr: str, value: Any, db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> Optional[ModelType]:
         db_session = db_session or get_ctx_session()
-        query = select(self.model).where(getattr(self.model, attr) == value)
-        response = await db_session.execute(query)
+        response = await db_session.execute(self._get_by_statement(attr, load), {"value": value})
         return response.scalar_one_or_none()
 
     async def get_by_ids(
         self,
         ids: List[Union[UUID, str]],
         db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
     ) -> Optional[List[ModelType]]:
         db_session = db_session or get_ctx_session()
-        response = await db_session.execute(select(self.model).where(self.model.id.in_(ids)))
+        response = await db_session.execute(self._get_by_ids_statement(load), {"ids": list(ids)})
         return response.scalars().all()
 
-    async def get_count(self, db_session: Optional[AsyncSession] = None) -> int:
-        db_session = db_session or get_ctx_session()
-        response = await db_session.execute(select(func.count()).select_from(select(self.model).subquery()))
-        return response.scalar_one()
+    async def get_count(
+        self, db_session: Optional[AsyncSession] = None, count_strategy: ICountStrategyEnum = ICountStrategyEnum.exact
+    ) -> Optional[int]:
+        """Number of rows of the table, see `count_rows` for the strategies."""
+        db_session = db_session or get_ctx_read_session()
+        total, _ = await count_rows(db_session, select(self.model), count_strategy)
+        return total
+
+    async def _paginate(
+        self,
+        db_session: AsyncSession,
+        query: Select,
+        params: Params,
+        count_strategy: Optional[ICountStrategyEnum] = None,
+    ) -> IPage:
+        """
+        Page of `query`, its total counted with `count_strategy`, by default the strategy of the request set by
+        the `count_strategy` dependency. One more row than the page size is read to tell whether there is a
+        next page.
+        """
+        raw_params = params.to_raw_params()
+        total, estimated = await count_rows(db_session, query, count_strategy or get_ctx_count_strategy())
+
+        response = await db_session.execute(query.limit(raw_params.limit + 1).offset(raw_params.offset))
+        items = unwrap_scalars(response.unique().all())
+        has_next = len(items) > raw_params.limit
+        items = items[: raw_params.limit]
+        if not has_next and (items or raw_params.offset == 0) and (total is None or estimated):
+            # the last page, the total is known
+            total, estimated = raw_params.offset + len(items), False
+        return IPage.create(items, params, total=total, has_next=has_next, total_estimated=estimated)
 
     async def get_one(
         self, *, query: Optional[Union[T, Select[T]]] = None, db_session: Optional[AsyncSession] = None
@@ -73,12 +177,13 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self,
         *,
         query: Optional[Union[T, Select[T]]] = None,
+        load: Optional[str] = None,
         db_session: Optional[AsyncSession] = None,
     ) -> List[ModelType]:
-        db_session = db_session or get_ctx_session()
+        db_session = db_session or get_ctx_read_session()
         if query is None:
             query = select(self.model).order_by(self.model.id)
-        response = await db_session.execute(query)
+        response = await db_session.execute(query.options(*self.get_load_options(load)))
         return response.scalars().all()
 
     async def get_multi_paginated(
@@ -86,14 +191,17 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         *,
         query: Optional[Union[T, Select[T]]] = None,
         params: Params = Params(),
+        load: Optional[str] = None,
+        count_strategy: Optional[ICountStrategyEnum] = None,
         db_session: Optional[AsyncSession] = None,
-    ) -> Page[ModelType]:
-        db_session = db_session or get_ctx_session()
+    ) -> IPage[ModelType]:
+        db_session = db_session or get_ctx_read_session()
         if query is None:
             query = select(self.model)
+        query = query.options(*self.get_load_options(load))
         try:
             logging.debug(f"Paginate query: {query}")
-            return await paginate(db_session, query, params)
+            return await self._paginate(db_session, query, params, count_strategy)
         except exc.ProgrammingError as e:
             logging.error(e)
             raise HTTPException(
@@ -108,9 +216,11 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         order: Optional[IOrderEnum] = IOrderEnum.asc,
         params: Params = Params(),
         selectexp: Optional[Union[T, Select[T]]] = None,
+        load: Optional[str] = None,
+        count_strategy: Optional[ICountStrategyEnum] = None,
         db_session: Optional[AsyncSession] = None,
-    ) -> Page[ModelType]:
-        db_session = db_session or get_ctx_session()
+    ) -> IPage[ModelType]:
+        db_session = db_session or get_ctx_read_session()
 
         columns = self.model.__table__.columns
 
@@ -126,7 +236,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         if selectexp is None:
             selectexp = select(self.model)
 
-        query = selectexp
+        query = selectexp.options(*self.get_load_options(load))
 
         if order_by is not None:
             if order == IOrderEnum.asc:
@@ -136,7 +246,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
         try:
             logging.debug(f"Paginate query: {query}")
-            return await paginate(db_session, query, params)
+            return await self._paginate(db_session, query, params, count_strategy)
         except exc.ProgrammingError as e:
             logging.error(e)
             raise HTTPException(
@@ -265,9 +375,11 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         filters: FilterQuery = FilterQuery(),
         params: Params = Params(),
         selectexp: Optional[Union[T, Select[T]]] = None,
+        load: Optional[str] = None,
+        count_strategy: Optional[ICountStrategyEnum] = None,
         db_session: Optional[AsyncSession] = None,
-    ) -> Page[ModelType]:
-        db_session = db_session or get_ctx_session()
+    ) -> IPage[ModelType]:
+        db_session = db_session or get_ctx_read_session()
         columns = self.model.__table__.columns
 
         if filters.filter_by is None:
@@ -276,20 +388,150 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 order_by=filters.order_by,
                 order=filters.order,
                 selectexp=selectexp,
+                load=load,
+                count_strategy=count_strategy,
                 db_session=db_session,
             )
 
-        query = self._select_from_filter(columns, filters, selectexp)
+        query = self._select_from_filter(columns, filters, selectexp).options(*self.get_load_options(load))
 
         try:
             logging.debug(f"Paginate query: {query}")
-            return await paginate(db_session, query, params)
+            return await self._paginate(db_session, query, params, count_strategy)
+        except exc.ProgrammingError as e:
+            logging.error(e)
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=str(e.orig).splitlines()[0],
+            )
+
+    def _after_cursor(
+        self, cursor: str, order_by: str, order: IOrderEnum, order_column: ColumnElement, id_column: ColumnElement
+    ) -> ColumnElement:
+        """
+        Condition selecting the rows after `cursor` in (order_column, id) order, nulls coming last in ascending
+        order and first in descending order as in PostgreSQL.
+        """
+        try:
+            cursor_order_by, cursor_order, value, last_id = decode_cursor(cursor)
+            if value is not None:
+                value = parse_obj_as(_python_type(order_column), value)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Invalid cursor")
+        if (cursor_order_by, cursor_order) != (order_by, order.value):
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail="The cursor was issued for another order_by or order",
+            )
+
+        last_id = literal(last_id, id_column.type)
+        descending = order == IOrderEnum.desc
+        after_id = id_column < last_id if descending else id_column > last_id
+        if order_column is id_column:
+            return after_id
+        if value is None:
+            if descending:
+                return or_(order_column.is_not(None), and_(order_column.is_(None), after_id))
+            return and_(order_column.is_(None), after_id)
+
+        # a row value comparison, PostgreSQL resolves it with a single index range scan
+        key, last_key = tuple_(order_column, id_column), tuple_(literal(value, order_column.type), last_id)
+        after_key = key < last_key if descending else key > last_key
+        if order_column.nullable and not descending:
+            return or_(after_key, order_column.is_(None))
+        return after_key
+
+    async def get_multi_cursor_paginated(
+        self,
+        *,
+        filters: FilterQuery = FilterQuery(),
+        params: CursorQuery = CursorQuery(),
+        selectexp: Optional[Union[T, Select[T]]] = None,
+        load: Optional[str] = None,
+        db_session: Optional[AsyncSession] = None,
+    ) -> ICursorPage[ModelType]:
+        """
+        Page of the filtered query following `params.cursor`, ordered by `filters.order_by` then by id.
+        Unlike OFFSET, a page costs the same whatever its depth: the cursor holds the sort key of the last row
+        of the previous page and the page starts right after it. One more row than the page size is read to
+        know whether a next page exists, no count is made.
+        """
+        db_session = db_session or get_ctx_read_session()
+        columns = self.model.__table__.columns
+
+        order_by = filters.order_by or "id"
+        order = filters.order or IOrderEnum.asc
+        if order_by not in columns:
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=f"order_by must be a valid column from {columns.keys()}",
+            )
+        order_column, id_column = columns[order_by], columns["id"]
+
+        query = self._select_from_filter(columns, filters.copy(update={"order_by": None}), selectexp)
+        if params.cursor is not None:
+            query = query.where(self._after_cursor(params.cursor, order_by, order, order_column, id_column))
+
+        if order == IOrderEnum.desc:
+            order_clauses = [order_column.desc().nulls_first(), id_column.desc()]
+        else:
+            order_clauses = [order_column.asc().nulls_last(), id_column.asc()]
+        if order_column is id_column:
+            order_clauses = order_clauses[1:]
+        query = query.order_by(*order_clauses).limit(params.size + 1).options(*self.get_load_options(load))
+
+        try:
+            logging.debug(f"Cursor paginate query: {query}")
+            response = await db_session.execute(query)
+        except exc.ProgrammingError as e:
+            logging.error(e)
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=str(e.orig).splitlines()[0],
+            )
+        items = response.scalars().all()
+
+        next_cursor = None
+        if len(items) > params.size:
+            items = items[: params.size]
+            last = items[-1]
+            next_cursor = encode_cursor([order_by, order.value, getattr(last, order_column.key), last.id])
+        return ICursorPage(items=items, size=params.size, next_cursor=next_cursor)
+
+    def get_export_columns(self, schema: Type[BaseModel]) -> List[Column]:
+        """The id then the columns `schema` reads, other columns such as secrets are never exported."""
+        table = self.model.__table__
+        return [table.c.id] + [table.c[name] for name in schema.__fields__ if name in table.c and name != "id"]
+
+    async def stream_multi_filtered(
+        self,
+        *,
+        columns: List[Column],
+        filters: FilterQuery = FilterQuery(),
+        partition_size: int = settings.EXPORT_PARTITION_SIZE,
+        db_session: Optional[AsyncSession] = None,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Rows of `columns` matching `filters`, in partitions of `partition_size` rows read from a server-side
+        cursor: memory stays bounded whatever the number of rows and the first partition is available before
+        the query has gone through the table. Rows are tuples, no model instance is built nor kept in the
+        session. Filters and order are limited to `columns`, ties and the default order are by id.
+        """
+        db_session = db_session or get_ctx_read_session()
+
+        query = self._select_from_filter({column.key: column for column in columns}, filters, select(*columns))
+        query = query.order_by(self.model.__table__.c.id).execution_options(yield_per=partition_size)
+
+        try:
+            logging.debug(f"Stream query: {query}")
+            response = await db_session.stream(query)
         except exc.ProgrammingError as e:
             logging.error(e)
             raise HTTPException(
                 status_code=status.HTTP_406_NOT_ACCEPTABLE,
                 detail=str(e.orig).splitlines()[0],
             )
+        return response.partitions()
 
     async def get_multi_grouped_paginated(
         self,
@@ -297,9 +539,10 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         filters: FilterQuery = FilterQuery(),
         groups: GroupQuery = GroupQuery(),
         params: Params = Params(),
+        count_strategy: Optional[ICountStrategyEnum] = None,
         db_session: Optional[AsyncSession] = None,
-    ) -> Page[ModelType]:
-        db_session = db_session or get_ctx_session()
+    ) -> IPage[ModelType]:
+        db_session = db_session or get_ctx_read_session()
 
         columns = self.model.__table__.columns
 
@@ -403,7 +646,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
         try:
             logging.debug(f"Paginate query: {query}")
-            return await paginate(db_session, query, params)
+            return await self._paginate(db_session, query, params, count_strategy)
         except exc.ProgrammingError as e:
             logging.error(e)
             raise HTTPException(
@@ -418,9 +661,10 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         order: Optional[IOrderEnum] = IOrderEnum.asc,
         offset: int = 0,
         limit: int = 100,
+        load: Optional[str] = None,
         db_session: Optional[AsyncSession] = None,
     ) -> List[ModelType]:
-        db_session = db_session or get_ctx_session()
+        db_session = db_session or get_ctx_read_session()
 
         columns = self.model.__table__.columns
 
@@ -433,7 +677,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             else:
                 order_by = columns[order_by]
 
-        query = select(self.model).offset(offset).limit(limit)
+        query = select(self.model).offset(offset).limit(limit).options(*self.get_load_options(load))
 
         if order_by is not None:
             if order == IOrderEnum.asc:
@@ -449,6 +693,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self,
         obj_in: Union[CreateSchemaType, ModelType],
         db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
     ) -> ModelType:
         db_session = db_session or get_ctx_session()
         db_obj = self.model.from_orm(obj_in)  # type: ignore
@@ -464,35 +709,216 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 status_code=status.HTTP_406_NOT_ACCEPTABLE,
                 detail=str(e),
             )
-        await db_session.refresh(db_obj)
+        return await self.refresh(db_obj, db_session, load)
+
+    def _insert_rows(self, objects: List[Union[CreateSchemaType, ModelType]]) -> List[Dict[str, Any]]:
+        columns = self.model.__table__.columns
+        rows = []
+        for obj_in in objects:
+            values = obj_in.dict() if isinstance(obj_in, BaseModel) else dict(obj_in)
+            rows.append({key: value for key, value in values.items() if key in columns})
+        return rows
+
+    def _timestamps(self, now: Any, *names: str) -> Dict[str, Any]:
+        """`now` for the timestamp columns among `names` that the table has, link tables have none."""
+        return {name: now for name in names if name in self.model.__table__.columns}
+
+    def _identity_key(self, row: Mapping[str, Any]) -> Tuple[Any, ...]:
+        mapper = inspect(self.model)
+        return mapper.identity_key_from_primary_key([row[column.key] for column in mapper.primary_key])
+
+    def _from_row(self, row: Mapping[str, Any]) -> ModelType:
+        db_obj = inspect(self.model).class_manager.new_instance()
+        for key, value in row.items():
+            setattr(db_obj, key, value)
         return db_obj
 
+    def _hydrate(self, db_session: AsyncSession, rows: Iterable[Mapping[str, Any]]) -> List[ModelType]:
+        """
+        Persistent instances of rows known to be in the database, built the way a query loads them: without
+        validation and without a SELECT. Instances already in the session are updated in place.
+        """
+        identity_map = db_session.sync_session.identity_map
+        instances = []
+        for row in rows:
+            if (db_obj := identity_map.get(self._identity_key(row))) is not None:
+                for key, value in row.items():
+                    set_committed_value(db_obj, key, value)
+                instances.append(db_obj)
+                continue
+            db_obj = self._from_row(row)
+            make_transient_to_detached(db_obj)
+            db_session.add(db_obj)
+            instances.append(db_obj)
+        return instances
+
+    async def _load_batch(self, db_session: AsyncSession, instances: List[ModelType], load: Optional[str]):
+        """Loads the relationships of the `load` profile on `instances` with one query."""
+        if load is not None and instances:
+            await db_session.execute(
+                self._get_by_ids_statement(load),
+                {"ids": [db_obj.id for db_obj in instances]},
+                execution_options={"populate_existing": True},
+            )
+
+    async def _insert_returning(self, db_session: AsyncSession, rows: List[Dict[str, Any]]) -> List[ModelType]:
+        table = self.model.__table__
+        timestamps = self._timestamps(func.now(), "created_at", "updated_at")
+        for row in rows:
+            row.update(timestamps)
+        # PostgreSQL takes at most 32767 parameters per statement
+        chunk_size = max(1, 32767 // len(table.columns))
+        returned = []
+        for start in range(0, len(rows), chunk_size):
+            query = insert(table).values(rows[start : start + chunk_size]).returning(*table.columns)
+            response = await db_session.execute(query)
+            returned.extend(row._mapping for row in response)
+        return self._hydrate(db_session, returned)
+
+    async def _insert_copy(self, db_session: AsyncSession, rows: List[Dict[str, Any]]) -> List[ModelType]:
+        table = self.model.__table__
+        connection = await db_session.connection()
+        # the timestamps of the returning mode, reading it also starts the transaction COPY runs in
+        now = (await connection.execute(select(func.now()))).scalar_one()
+        timestamps = self._timestamps(now, "created_at", "updated_at")
+        processors = {column.key: column.type.bind_processor(connection.dialect) for column in table.columns}
+        for row in rows:
+            row.update(timestamps)
+            # COPY doesn't apply the column defaults, they are filled in here
+            for column in table.columns:
+                if column.key not in row and column.default is not None:
+                    default = column.default
+                    row[column.key] = default.arg(None) if default.is_callable else default.arg
+
+        records = [
+            tuple(processors[key](row.get(key)) if processors[key] else row.get(key) for key in table.columns.keys())
+            for row in rows
+        ]
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        try:
+            await driver_connection.copy_records_to_table(
+                table.name, schema_name=table.schema, columns=table.columns.keys(), records=records
+            )
+        except asyncpg.IntegrityConstraintViolationError as e:
+            await db_session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=str(e),
+            )
+        return self._hydrate(db_session, rows)
+
     async def create_multi(
         self,
         objects: List[Union[CreateSchemaType, ModelType]],
         db_session: Optional[AsyncSession] = None,
+        mode: Literal["orm", "returning", "copy"] = "returning",
+        load: Optional[str] = None,
     ) -> List[ModelType]:
+        """
+        Inserts `objects` in bulk and returns them as persistent instances, without a SELECT per row.
+        **Parameters**
+        * `mode`:
+            * `orm`: through the unit of work, one refresh per row, for models relying on ORM events
+            * `returning`: multi-row `INSERT ... RETURNING` statements of up to 32767 parameters
+            * `copy`: `COPY` for very large batches, the ids and column defaults are set by the application and
+              the timestamps read from the transaction, as `returning` does
+        * `load`: Load profile of the returned objects, loaded with one query for the whole batch
+        """
         db_session = db_session or get_ctx_session()
-        instances = []
-        for obj_in in objects:
-            db_obj = self.model.from_orm(obj_in)  # type: ignore
-            db_obj.created_at = datetime.utcnow()
-            db_obj.updated_at = datetime.utcnow()
-            instances.append(db_obj)
+        if not objects:
+            return []
+
+        if mode == "orm":
+            instances = []
+            for obj_in in objects:
+                db_obj = self.model.from_orm(obj_in)  # type: ignore
+                db_obj.created_at = datetime.utcnow()
+                db_obj.updated_at = datetime.utcnow()
+                instances.append(db_obj)
+            try:
+                db_session.add_all(instances)
+                await db_session.flush()
+            except exc.IntegrityError as e:
+                await db_session.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                    detail=str(e),
+                )
+            for db_obj in instances:
+                await db_session.refresh(db_obj)
+        else:
+            rows = self._insert_rows(objects)
+            try:
+                if mode == "copy":
+                    instances = await self._insert_copy(db_session, rows)
+                else:
+                    instances = await self._insert_returning(db_session, rows)
+            except exc.IntegrityError as e:
+                await db_session.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                    detail=str(e),
+                )
+
+        await self._load_batch(db_session, instances, load)
+        return instances
+
+    async def upsert_multi(
+        self,
+        objects: List[Union[CreateSchemaType, ModelType]],
+        index_elements: Sequence[str] = ("id",),
+        update_fields: Optional[Sequence[str]] = None,
+        db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
+    ) -> List[ModelType]:
+        """
+        Inserts `objects`, updating the rows that already exist, with `INSERT ... ON CONFLICT DO UPDATE ...
+        RETURNING` statements: the number of statements doesn't depend on the number of objects.
+        **Parameters**
+        * `index_elements`: Columns of the unique index telling whether a row exists
+        * `update_fields`: Columns updated on existing rows, by default the fields set on all the objects
+        * `load`: Load profile of the returned objects, loaded with one query for the whole batch
+        """
+        db_session = db_session or get_ctx_session()
+        if not objects:
+            return []
+
+        table = self.model.__table__
+        rows = self._insert_rows(objects)
+        if update_fields is None:
+            fields_set = set.intersection(
+                *(obj.__fields_set__ if isinstance(obj, BaseModel) else set(obj) for obj in objects)
+            )
+            update_fields = [key for key in rows[0] if key in fields_set and key not in index_elements and key != "id"]
+        timestamps = self._timestamps(func.now(), "created_at", "updated_at")
+        for row in rows:
+            row.update(timestamps)
 
+        # Core statements don't autoflush, pending changes would be overwritten by the returned rows
+        await db_session.flush()
+        # PostgreSQL takes at most 32767 parameters per statement
+        chunk_size = max(1, 32767 // len(table.columns))
+        returned = []
         try:
-            db_session.add_all(instances)
-            await db_session.flush()
+            for start in range(0, len(rows), chunk_size):
+                query = pg_insert(table).values(rows[start : start + chunk_size])
+                set_ = {key: query.excluded[key] for key in update_fields}
+                set_.update(self._timestamps(func.now(), "updated_at"))
+                # with nothing to update, a no-op assignment still returns the existing rows
+                set_ = set_ or {index_elements[0]: query.excluded[index_elements[0]]}
+                query = query.on_conflict_do_update(index_elements=index_elements, set_=set_).returning(*table.columns)
+                response = await db_session.execute(query)
+                returned.extend(row._mapping for row in response)
         except exc.IntegrityError as e:
             await db_session.rollback()
             raise HTTPException(
                 status_code=status.HTTP_406_NOT_ACCEPTABLE,
                 detail=str(e),
             )
+        instances = self._hydrate(db_session, returned)
 
-        for db_obj in instances:
-            await db_session.refresh(db_obj)
-
+        await self._load_batch(db_session, instances, load)
         return instances
 
     async def update(
@@ -501,9 +927,16 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj_current: ModelType,
         obj_new: Union[UpdateSchemaType, Dict[str, Any], ModelType],
         db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
     ) -> ModelType:
+        """
+        Writes the columns of `obj_new` that differ from `obj_current` with one `UPDATE ... RETURNING` statement.
+        Models with a `version` column are only updated while the row has the version of `obj_current`, or the
+        `version` of `obj_new` when it is set, StaleDataException is raised otherwise: the update of a
+        concurrent writer is never overwritten.
+        """
         db_session = db_session or get_ctx_session()
-        obj_data = jsonable_encoder(obj_current)
+        columns = self.model.__table__.columns
 
         if isinstance(obj_new, dict):
             update_data = obj_new
@@ -511,31 +944,120 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             update_data = obj_new.dict(
                 exclude_unset=True
             )  # This tells Pydantic to not include the values that were not sent
-        for field in obj_data:
-            if field in update_data:
-                setattr(obj_current, field, update_data[field])
-            if field == "updated_at":
-                setattr(obj_current, field, datetime.utcnow())
-
-        db_session.add(obj_current)
+        loaded = inspect(obj_current).dict
+        changes = {
+            key: value
+            for key, value in update_data.items()
+            if key in columns and key not in _WRITE_ONCE_COLUMNS and (key not in loaded or loaded[key] != value)
+        }
+        if not changes:
+            await self._load_batch(db_session, [obj_current], load)
+            return obj_current
+
+        whereclause = [columns.id == obj_current.id]
+        # a version sent as null is not a version, the one loaded with `obj_current` is checked instead
+        version = update_data.get("version")
+        if version is None:
+            version = loaded.get("version")
+        versioned = "version" in columns and version is not None
+        if versioned:
+            whereclause.append(columns.version == version)
+            changes["version"] = columns.version + 1
+        updated = await self.update_where(changes, *whereclause, db_session=db_session)
+        if not updated:
+            if versioned:
+                raise StaleDataException(self.model, obj_current.id)
+            raise IdNotFoundException(self.model, obj_current.id)
+
+        await self._load_batch(db_session, updated, load)
+        return updated[0]
+
+    async def update_where(
+        self,
+        values: Dict[str, Any],
+        *whereclause: ColumnElement,
+        db_session: Optional[AsyncSession] = None,
+    ) -> List[ModelType]:
+        """
+        Sets `values` on the rows matching `whereclause` with one `UPDATE ... RETURNING` statement and returns
+        them, the instances already in the session are updated in place.
+        """
+        db_session = db_session or get_ctx_session()
+        table = self.model.__table__
         await db_session.flush()
-        await db_session.refresh(obj_current)
-        return obj_current
+        query = update(table).where(*whereclause).values({**values, **self._timestamps(func.now(), "updated_at")})
+        try:
+            response = await db_session.execute(query.returning(*table.columns))
+        except exc.IntegrityError as e:
+            await db_session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=str(e),
+            )
+        return self._hydrate(db_session, response.mappings().all())
 
-    async def delete(self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None) -> ModelType:
+    async def delete_where(
+        self, *whereclause: ColumnElement, db_session: Optional[AsyncSession] = None
+    ) -> List[ModelType]:
+        """
+        Deletes the rows matching `whereclause` with one `DELETE ... RETURNING` statement and returns them.
+        Their instances are removed from the session, the rows referencing them are left to the foreign keys.
+        """
         db_session = db_session or get_ctx_session()
-        response = await db_session.execute(select(self.model).where(self.model.id == id))
-        obj = response.scalar_one()
-        await db_session.delete(obj)
+        table = self.model.__table__
         await db_session.flush()
-        return obj
+        try:
+            response = await db_session.execute(delete(table).where(*whereclause).returning(*table.columns))
+        except exc.IntegrityError as e:
+            await db_session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=str(e),
+            )
+
+        identity_map = db_session.sync_session.identity_map
+        deleted = []
+        for row in response.mappings().all():
+            if (db_obj := identity_map.get(self._identity_key(row))) is not None:
+                db_session.expunge(db_obj)
+            else:
+                db_obj = self._from_row(row)
+            deleted.append(db_obj)
+        return deleted
+
+    async def delete(
+        self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> ModelType:
+        """
+        Deletes the row with a single statement. With `load` the object is selected first with the
+        relationships of the profile, as they can't be read once the row is gone.
+        """
+        db_session = db_session or get_ctx_session()
+        if load is not None:
+            await db_session.execute(self._get_by_statement("id", load), {"value": id})
+        deleted = await self.delete_where(self.model.id == id, db_session=db_session)
+        if not deleted:
+            raise IdNotFoundException(self.model, id)
+        return deleted[0]
 
     async def refresh(
         self,
         obj_current: ModelType,
         db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
     ) -> ModelType:
+        """
+        Flushes and reloads the object. A session refresh leaves its relationships unloaded, with `load` it is
+        selected again with the relationships of the profile, replacing the state held by the session.
+        """
         db_session = db_session or get_ctx_session()
         await db_session.flush()
-        await db_session.refresh(obj_current)
-        return obj_current
+        if load is None:
+            await db_session.refresh(obj_current)
+            return obj_current
+        response = await db_session.execute(
+            self._get_by_statement("id", load),
+            {"value": obj_current.id},
+            execution_options={"populate_existing": True},
+        )
+        return response.scalar_one()
@@ -1,10 +1,41 @@
+from typing import Any, Dict, Optional, Union
+from uuid import UUID
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
 from crud.base_crud import CRUDBase
+from middlewares.asql import get_ctx_session, on_commit
 from models.group_model import Group
-from schemas.group_schema import IGroupCreate, IGroupUpdate
+from models.links_model import GroupUserLink
+from schemas.group_schema import IGroupCreate, IGroupRead, IGroupUpdate
+from utils.principal_cache import principal_cache
 
 
 class CRUDGroup(CRUDBase[Group, IGroupCreate, IGroupUpdate]):
-    pass
+    async def update(
+        self,
+        *,
+        obj_current: Group,
+        obj_new: Union[IGroupUpdate, Dict[str, Any], Group],
+        db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
+    ) -> Group:
+        db_session = db_session or get_ctx_session()
+        name = obj_current.name
+        group = await super().update(obj_current=obj_current, obj_new=obj_new, db_session=db_session, load=load)
+        if group.name != name:
+            # the principals of the members hold the group name
+            on_commit(principal_cache.invalidate_all, db_session)
+        return group
+
+    async def delete(
+        self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> Group:
+        db_session = db_session or get_ctx_session()
+        group = await super().delete(id, db_session, load)
+        on_commit(principal_cache.invalidate_all, db_session)
+        return group
 
 
-group = CRUDGroup(Group)
+group = CRUDGroup(Group, load_profiles={"read": IGroupRead})
+group_user_link = CRUDBase(GroupUserLink)
@@ -1,24 +1,57 @@
-from typing import Optional
+from typing import Any, Dict, Optional, Union
 from uuid import UUID
 
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from crud.base_crud import CRUDBase
-from middlewares.asql import get_ctx_session
+from crud.user_crud import user as crud_user
+from middlewares.asql import get_ctx_session, on_commit
 from models.role_model import Role
 from models.user_model import User
-from schemas.role_schema import IRoleCreate, IRoleUpdate
+from schemas.role_schema import IRoleCreate, IRoleRead, IRoleUpdate
+from utils.principal_cache import principal_cache
 
 
 class CRUDRole(CRUDBase[Role, IRoleCreate, IRoleUpdate]):
-    async def add_role_to_user(self, *, user: User, role_id: UUID, db_session: Optional[AsyncSession] = None) -> Role:
+    async def add_role_to_user(
+        self, *, user: User, role_id: UUID, db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> Role:
         db_session = db_session or get_ctx_session()
-        role = await super().get(id=role_id)
-        role.users.append(user)
-        db_session.add(role)
-        await db_session.flush()
-        await db_session.refresh(role)
+        role = await super().get(id=role_id, db_session=db_session)
+        user.role_id = role.id
+        db_session.add(user)
+        crud_user.invalidate_principal(user.id, db_session)
+        return await self.refresh(role, db_session, load)
+
+    async def update(
+        self,
+        *,
+        obj_current: Role,
+        obj_new: Union[IRoleUpdate, Dict[str, Any], Role],
+        db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
+    ) -> Role:
+        db_session = db_session or get_ctx_session()
+        name = obj_current.name
+        role = await super().update(obj_current=obj_current, obj_new=obj_new, db_session=db_session, load=load)
+        if role.name != name:
+            # the principals of the users of the role hold its name
+            on_commit(principal_cache.invalidate_all, db_session)
         return role
 
+    async def delete(
+        self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> Role:
+        """
+        Detaches the users of the role before deleting it, `User.role_id` has no ON DELETE clause
+        """
+        db_session = db_session or get_ctx_session()
+        users = await crud_user.update_where(
+            {"role_id": None, "version": User.version + 1}, User.role_id == id, db_session=db_session
+        )
+        for user in users:
+            crud_user.invalidate_principal(user.id, db_session)
+        return await super().delete(id, db_session, load)
+
 
-role = CRUDRole(Role)
+role = CRUDRole(Role, load_profiles={"read": IRoleRead})
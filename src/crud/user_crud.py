@@ -1,56 +1,119 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional, Union
 from uuid import UUID
 
 from pydantic.networks import EmailStr
-from sqlmodel import select
+from sqlmodel import func, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from core.hashing import password_hasher
 from core.security import get_password_hash, verify_password
 from crud.base_crud import CRUDBase
+from crud.group_crud import group_user_link
+from crud.socialaccount_crud import socialaccount
+from crud.wallet_crud import wallet
 from exceptions.common_exception import IdNotFoundException
-from middlewares.asql import get_ctx_session
+from middlewares.asql import ContextDatabase, get_ctx_session, on_commit
+from middlewares.redis import ContextClient
+from models.group_model import Group
 from models.links_model import GroupUserLink
 from models.media_model import ImageMedia, Media
+from models.role_model import Role
 from models.socialaccount_model import SocialAccount
 from models.user_model import User
 from models.wallet_model import Wallet
 from schemas.media_schema import IMediaCreate
-from schemas.user_schema import IUserCreate, IUserUpdate
+from schemas.user_schema import IUserCreate, IUserPrincipal, IUserRead, IUserReadBasic, IUserUpdate
+from utils.principal_cache import principal_cache
+from utils.tasks import create_background_task
 
 
 class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
-    async def create(self, *, obj_in: IUserCreate, db_session: Optional[AsyncSession] = None) -> User:
+    async def create(
+        self, *, obj_in: IUserCreate, db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> User:
         db_obj = self.model.from_orm(obj_in)
         if obj_in.password:
-            db_obj.hashed_password = get_password_hash(obj_in.password)
-        user = await super().create(db_obj, db_session)
+            db_obj.hashed_password = await get_password_hash(obj_in.password)
+        user = await super().create(db_obj, db_session, load)
+        return user
+
+    async def get_principal(
+        self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None
+    ) -> Optional[IUserPrincipal]:
+        """
+        Loads the identity of a user with its role and group names in a single query
+        """
+        db_session = db_session or get_ctx_session()
+        query = (
+            select(
+                self.model.id,
+                self.model.is_active,
+                Role.name,
+                func.array_agg(Group.name).filter(Group.name.isnot(None)),
+            )
+            .outerjoin(Role, Role.id == self.model.role_id)
+            .outerjoin(GroupUserLink, GroupUserLink.user_id == self.model.id)
+            .outerjoin(Group, Group.id == GroupUserLink.group_id)
+            .where(self.model.id == id)
+            .group_by(self.model.id, Role.name)
+        )
+        response = await db_session.execute(query)
+        row = response.one_or_none()
+        if row is None:
+            return None
+        user_id, is_active, role, groups = row
+        return IUserPrincipal(id=user_id, is_active=is_active, role=role, groups=groups or [])
+
+    def invalidate_principal(self, user_id: UUID, db_session: Optional[AsyncSession] = None):
+        """
+        Drops the cached principal of the user once the current transaction is committed
+        """
+        on_commit(lambda: principal_cache.invalidate(user_id), db_session)
+
+    async def update(
+        self,
+        *,
+        obj_current: User,
+        obj_new: Union[IUserUpdate, Dict[str, Any], User],
+        db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
+    ) -> User:
+        user = await super().update(obj_current=obj_current, obj_new=obj_new, db_session=db_session, load=load)
+        self.invalidate_principal(user.id, db_session)
+        return user
+
+    async def delete(
+        self, id: Union[UUID, str], db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> User:
+        user = await super().delete(id, db_session, load)
+        self.invalidate_principal(user.id, db_session)
         return user
 
     async def remove_from_all_groups(self, user: User, db_session: Optional[AsyncSession] = None) -> User:
         db_session = db_session or get_ctx_session()
-        response = await db_session.execute(select(GroupUserLink).where(GroupUserLink.user_id == user.id))
-        for obj in response.scalars().all():
-            await db_session.delete(obj)
-        await db_session.flush()
+        await group_user_link.delete_where(GroupUserLink.user_id == user.id, db_session=db_session)
         await db_session.refresh(user)
+        self.invalidate_principal(user.id, db_session)
         return user
 
     async def add_to_group(self, user: User, group_id: UUID, db_session: Optional[AsyncSession] = None) -> User:
         db_session = db_session or get_ctx_session()
-        for group in user.groups:
-            if group.id == group_id:
-                return user
+        if await db_session.get(GroupUserLink, (group_id, user.id)):
+            return user
         db_session.add(GroupUserLink(group_id=group_id, user_id=user.id))
         await db_session.flush()
         await db_session.refresh(user)
+        self.invalidate_principal(user.id, db_session)
         return user
 
     async def remove_from_group(self, user: User, group_id: UUID, db_session: Optional[AsyncSession] = None) -> User:
         db_session = db_session or get_ctx_session()
-        db_session.delete(GroupUserLink(group_id=group_id, user_id=user.id))
-        await db_session.flush()
+        await group_user_link.delete_where(
+            GroupUserLink.group_id == group_id, GroupUserLink.user_id == user.id, db_session=db_session
+        )
         await db_session.refresh(user)
+        self.invalidate_principal(user.id, db_session)
         return user
 
     async def attach_role(self, user: User, role_id: UUID, db_session: Optional[AsyncSession] = None) -> User:
@@ -59,29 +122,26 @@ class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
         db_session.add(user)
         await db_session.flush()
         await db_session.refresh(user)
+        self.invalidate_principal(user.id, db_session)
         return user
 
-    async def unlink_wallet(self, user: User, wallet_id: UUID, db_session: Optional[AsyncSession] = None) -> User:
+    async def unlink_wallet(
+        self, user: User, wallet_id: UUID, db_session: Optional[AsyncSession] = None, load: Optional[str] = None
+    ) -> User:
         db_session = db_session or get_ctx_session()
-        for wallet in user.wallets:
-            if wallet.id == wallet_id:
-                await db_session.delete(wallet)
-                await db_session.flush()
-                await db_session.refresh(user)
-                return user
-        raise IdNotFoundException(Wallet, wallet_id)
+        if not await wallet.delete_where(Wallet.id == wallet_id, Wallet.user_id == user.id, db_session=db_session):
+            raise IdNotFoundException(Wallet, wallet_id)
+        return await self.refresh(user, db_session, load)
 
     async def unlink_socialaccount(
-        self, user: User, account_id: UUID, db_session: Optional[AsyncSession] = None
+        self, user: User, account_id: UUID, db_session: Optional[AsyncSession] = None, load: Optional[str] = None
     ) -> User:
         db_session = db_session or get_ctx_session()
-        for account in user.social_accounts:
-            if account.id == account_id:
-                await db_session.delete(account)
-                await db_session.flush()
-                await db_session.refresh(user)
-                return user
-        raise IdNotFoundException(SocialAccount, account_id)
+        if not await socialaccount.delete_where(
+            SocialAccount.id == account_id, SocialAccount.user_id == user.id, db_session=db_session
+        ):
+            raise IdNotFoundException(SocialAccount, account_id)
+        return await self.refresh(user, db_session, load)
 
     async def add_social_login(
         self, *, user: User, social_login: str, db_session: Optional[AsyncSession] = None
@@ -100,10 +160,23 @@ class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
         user = await self.get_by("email", email)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password(password, user.hashed_password):
             return None
+        if password_hasher.needs_update(user.hashed_password):
+            create_background_task(self.rehash_password(user.id, user.hashed_password, password), name="rehash")
         return user
 
+    async def rehash_password(self, user_id: UUID, hashed_password: str, password: str):
+        """
+        Replaces a hash made with outdated parameters, unless the password changed in the meantime
+        """
+        new_hashed_password = await get_password_hash(password)
+        # the task outlives the request, its principal invalidation needs a client of its own
+        async with ContextClient(), ContextDatabase():
+            user = await self.get(id=user_id)
+            if user and user.hashed_password == hashed_password:
+                await self.update(obj_current=user, obj_new={"hashed_password": new_hashed_password})
+
     async def update_photo(
         self,
         *,
@@ -112,19 +185,22 @@ class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
         heigth: int,
         width: int,
         file_format: str,
-        db_session: Optional[AsyncSession] = None
+        db_session: Optional[AsyncSession] = None,
+        load: Optional[str] = None,
     ) -> User:
         db_session = db_session or get_ctx_session()
-        user.image = ImageMedia(
+        image_media = ImageMedia(
             media=Media.from_orm(image),
             height=heigth,
             width=width,
             file_format=file_format,
         )
+        db_session.add(image_media)
+        await db_session.flush()
+        # assigning user.image would load the replaced image, relationships are lazy="raise"
+        user.image_id = image_media.id
         db_session.add(user)
-        await db_session.commit()
-        await db_session.refresh(user)
-        return user
+        return await self.refresh(user, db_session, load)
 
 
-user = CRUDUser(User)
+user = CRUDUser(User, load_profiles={"read": IUserRead, "basic": IUserReadBasic})
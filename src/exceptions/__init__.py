@@ -1,2 +1,9 @@
-from .common_exception import ContentNoChangeException, IdNotFoundException, NameExistException, NameNotFoundException
+from .common_exception import (
+    ContentNoChangeException,
+    IdNotFoundException,
+    NameExistException,
+    NameNotFoundException,
+    StaleDataException,
+    TooManyRequestsException,
+)
 from .user_exceptions import UserSelfDeleteException
@@ -79,3 +79,30 @@ class NameExistException(HTTPException, Generic[ModelType]):
             detail=f"The {model.__name__} name already exists.",
             headers=headers,
         )
+
+
+class StaleDataException(HTTPException, Generic[ModelType]):
+    def __init__(
+        self,
+        model: Type[ModelType],
+        id: Optional[Union[UUID, str]] = None,
+        headers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"The {model.__name__} with id {id} was modified by another request, reload it and try again.",
+            headers=headers,
+        )
+
+
+class TooManyRequestsException(HTTPException):
+    def __init__(
+        self,
+        retry_after: int,
+        headers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later.",
+            headers={**(headers or {}), "Retry-After": str(retry_after)},
+        )
@@ -1,13 +1,18 @@
+import asyncio
 import logging
+import random
 from contextvars import ContextVar
-from typing import Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
-from starlette.types import ASGIApp
+from sqlalchemy.orm import ORMExecuteState, Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from core.pool import InstrumentedPool
 from core.settings import settings
+from middlewares.timing import instrument_engine
+from utils.slow_queries import slow_query_log
 
 
 class MissingSessionError(Exception):
@@ -38,34 +43,212 @@ class EngineNotInitialisedError(Exception):
         super().__init__(msg)
 
 
+class Replica:
+    """A read replica engine and the replication lag last measured on it."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.lag: Optional[float] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.lag is not None and self.lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+
+
+_engine_variants: Dict[Tuple[int, bool, bool, bool], AsyncEngine] = {}
+
+
+def _transaction_engine(engine: AsyncEngine, read_only: bool, deferrable: bool, replica: bool = False) -> AsyncEngine:
+    """
+    Engine sharing the pool of `engine` whose transactions start as READ ONLY, and DEFERRABLE when asked.
+    asyncpg folds the mode into BEGIN, it costs no extra round trip. Standbys do not support SERIALIZABLE,
+    deferrable reads on a replica use a REPEATABLE READ snapshot instead.
+    """
+    if not read_only and not deferrable:
+        return engine
+    key = (id(engine), read_only, deferrable, replica)
+    if key not in _engine_variants:
+        options: Dict[str, Any] = {"postgresql_readonly": True}
+        if deferrable:
+            options["isolation_level"] = "REPEATABLE READ" if replica else "SERIALIZABLE"
+            options["postgresql_deferrable"] = not replica
+        _engine_variants[key] = engine.execution_options(**options)
+    return _engine_variants[key]
+
+
+class _LazySession:
+    """Holds the sessions of a context, each session is only created when it is first requested."""
+
+    def __init__(self, session_args: Dict, read_only: bool = False, deferrable: bool = False):
+        self.session_args = session_args
+        self.read_only = read_only
+        self.deferrable = deferrable
+        self.session: Optional[AsyncSession] = None
+        self.replica_session: Optional[AsyncSession] = None
+
+    def get(self) -> AsyncSession:
+        if self.session is None:
+            engine = _transaction_engine(_engine, self.read_only, self.deferrable)
+            self.session = create_session(engine=engine, **self.session_args)
+            _track_writes(self.session)
+        return self.session
+
+    def get_read(self) -> AsyncSession:
+        # read your writes: once the context wrote, its reads stay on the primary
+        if self.session is not None and has_writes(self.session):
+            return self.session
+        if self.replica_session is not None:
+            return self.replica_session
+        if not (replicas := [replica for replica in _replicas if replica.healthy]):
+            return self.get()
+        engine = _transaction_engine(random.choice(replicas).engine, True, self.deferrable, replica=True)
+        self.replica_session = create_session(engine=engine, **self.session_args)
+        return self.replica_session
+
+
 _engine: Optional[AsyncEngine] = None
-_session: ContextVar[Optional[AsyncSession]] = ContextVar("_session", default=None)
+_replicas: List[Replica] = []
+_session: ContextVar[Optional[_LazySession]] = ContextVar("_session", default=None)
 
 
 def get_ctx_session() -> AsyncSession:
-    """Return an instance of Session local to the current async context."""
+    """Return an instance of Session local to the current async context, created on first use."""
     if _engine is None:
         raise EngineNotInitialisedError
 
-    session = _session.get()
-    if session is None:
+    lazy_session = _session.get()
+    if lazy_session is None:
         raise MissingSessionError
 
-    return session
+    return lazy_session.get()
+
+
+def get_ctx_read_session() -> AsyncSession:
+    """
+    Return a session for queries that tolerate replication lag. It is bound to a healthy replica unless
+    the current context already wrote through its primary session.
+    """
+    if _engine is None:
+        raise EngineNotInitialisedError
+
+    lazy_session = _session.get()
+    if lazy_session is None:
+        raise MissingSessionError
+
+    return lazy_session.get_read()
+
+
+def set_transaction_mode(read_only: bool = False, deferrable: bool = False):
+    """Choose the mode of the transactions of the current context, before its session is first used."""
+    lazy_session = _session.get()
+    if lazy_session is None:
+        raise MissingSessionError
+    if lazy_session.session is not None or lazy_session.replica_session is not None:
+        raise RuntimeError("The transaction mode must be set before the session is used")
+    lazy_session.read_only = read_only or deferrable
+    lazy_session.deferrable = deferrable
+
+
+def _after_flush(session: Session, flush_context: Any):
+    session.info["has_writes"] = True
+
+
+def _do_orm_execute(orm_execute_state: ORMExecuteState):
+    # textual statements are not inspected, they count as writes
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["has_writes"] = True
+
+
+def _track_writes(session: AsyncSession):
+    event.listen(session.sync_session, "after_flush", _after_flush)
+    event.listen(session.sync_session, "do_orm_execute", _do_orm_execute)
+
+
+def has_writes(session: AsyncSession) -> bool:
+    """Whether the session flushed or executed a write, or holds changes that are not flushed yet."""
+    return bool(session.info.get("has_writes") or session.new or session.dirty or session.deleted)
+
+
+def on_commit(callback: Callable[[], Awaitable[Any]], db_session: Optional[AsyncSession] = None):
+    """Run `callback` once the transaction of the session is committed, it is dropped on rollback."""
+    db_session = db_session or get_ctx_session()
+    db_session.info.setdefault("on_commit", []).append(callback)
+
+
+async def _commit(session: AsyncSession):
+    # a transaction that did not write has nothing to commit, closing the session ends it
+    if has_writes(session):
+        await session.commit()
+    for callback in session.info.pop("on_commit", []):
+        try:
+            await callback()
+        except Exception as e:
+            logging.warning(f"On commit callback failed: {e}")
 
 
 def create_engine(url: str, schema: str = None) -> AsyncEngine:
-    search_path = f"{schema},public" if schema else "public"
+    """
+    Engine whose pool is this worker share of DB_POOL_SIZE. With DB_PGBOUNCER, the engine is compatible with
+    a transaction pooler: prepared statements are not cached and no startup parameter is sent, the search
+    path must then be set on the database role.
+    """
+    if settings.DB_PGBOUNCER:
+        connect_args = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    else:
+        search_path = f"{schema},public" if schema else "public"
+        connect_args = {"server_settings": {"search_path": search_path}}
     engine = create_async_engine(
         url,
         echo=settings.DB_ECHO,
+        poolclass=InstrumentedPool,
         pool_size=settings.POOL_SIZE,
         max_overflow=settings.MAX_OVERFLOW,
-        connect_args={"server_settings": {"search_path": search_path}},
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        connect_args=connect_args,
     )
+    instrument_engine(engine)
+    slow_query_log.instrument(engine)
     return engine
 
 
+def get_pool_stats() -> Dict[str, Any]:
+    """Checkout statistics of the primary pool and of each replica pool of this worker."""
+    stats = {"primary": _engine.sync_engine.pool.get_stats() if _engine else None}
+    for replica in _replicas:
+        pool_stats = replica.engine.sync_engine.pool.get_stats()
+        stats[f"replica:{replica.engine.url.host}"] = {**pool_stats, "lag": replica.lag}
+    return stats
+
+
+_REPLICA_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+async def monitor_replicas(interval: float = settings.DB_REPLICA_LAG_CHECK_SECONDS):
+    """Measures the lag of every replica, a replica that can not be reached is treated as lagging."""
+    while True:
+        for replica in _replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    replica.lag = float((await connection.execute(_REPLICA_LAG_QUERY)).scalar_one())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Replica {replica.engine.url.host} unavailable: {e}")
+                replica.lag = None
+            if replica.lag is not None and not replica.healthy:
+                logging.warning(
+                    f"Replica {replica.engine.url.host} is {replica.lag:.1f}s behind, reads use the primary"
+                )
+        await asyncio.sleep(interval)
+
+
 def create_session(url: str = None, schema: str = None, engine: AsyncEngine = None) -> AsyncSession:
     session = AsyncSession(
         bind=engine or create_engine(url, schema),
@@ -77,39 +260,77 @@ def create_session(url: str = None, schema: str = None, engine: AsyncEngine = No
 
 
 class ContextDatabase:
-    def __init__(self, session_args: Dict = None):
+    def __init__(self, session_args: Dict = None, read_only: bool = False):
         self.token = None
         self.session_args = session_args or {}
+        self.read_only = read_only
 
     async def __aenter__(self):
         if _engine is None:
             raise EngineNotInitialisedError
 
-        self.token = _session.set(create_session(engine=_engine, **self.session_args))  # type: ignore
-        return type(self)
+        self.lazy_session = _LazySession(self.session_args, read_only=self.read_only)
+        self.token = _session.set(self.lazy_session)
+        return self
+
+    async def commit(self):
+        """Commit the session if it was used, nothing is sent to the database otherwise."""
+        if self.lazy_session.session is not None:
+            await _commit(self.lazy_session.session)
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        session = _session.get()
-        if exc_type is not None:
-            logging.info(f"Rolling back transaction due to error: {exc_value}")
-            await session.rollback()
+        session = self.lazy_session.session
+        try:
+            if self.lazy_session.replica_session is not None:
+                await self.lazy_session.replica_session.close()
+            if session is None:
+                return
+            if exc_type is not None:
+                logging.info(f"Rolling back transaction due to error: {exc_value}")
+                await session.rollback()
+                session.info.pop("on_commit", None)
+            else:
+                await _commit(session)
+            await session.close()
+        finally:
+            self.lazy_session.session = None
+            self.lazy_session.replica_session = None
+            _session.reset(self.token)
 
-        await session.commit()
-        await session.close()
-        _session.reset(self.token)
 
+class ContextDatabaseMiddleware:
+    """
+    Gives each HTTP request its own session, created the first time `get_ctx_session` is called.
+    The session is committed right before the response starts so a failed commit still becomes an error
+    response, requests that never use the session do not touch the database.
+    GET and HEAD requests run in READ ONLY transactions, routes that write on GET opt out with the
+    `transaction` dependency. Transactions that did not write are not committed.
+    With `replica_urls`, `get_ctx_read_session` spreads lag tolerant reads over the replicas whose lag,
+    measured by `monitor_replicas`, is below DB_REPLICA_MAX_LAG_SECONDS.
+    """
 
-class ContextDatabaseMiddleware(BaseHTTPMiddleware):
     def __init__(
         self,
         app: ASGIApp,
         url: str,
         schema: str = None,
+        replica_urls: List[str] = [],
     ):
-        super().__init__(app)
+        self.app = app
         global _engine
         _engine = create_engine(url, schema)
+        _replicas[:] = [Replica(create_engine(replica_url, schema)) for replica_url in replica_urls]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async with ContextDatabase(read_only=scope["method"] in ("GET", "HEAD")) as db:
+
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    await db.commit()
+                await send(message)
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
-        async with ContextDatabase():
-            return await call_next(request)
+            await self.app(scope, receive, send_wrapper)
@@ -1,9 +1,7 @@
 from contextvars import ContextVar
 from typing import Optional
 
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from utils.minio_client import Minio
 
@@ -52,9 +50,9 @@ def get_ctx_client() -> Minio:
     return client
 
 
-class ContextMinioMiddleware(BaseHTTPMiddleware):
+class ContextMinioMiddleware:
     def __init__(self, app: ASGIApp, minio_url: str, access_key: str, secret_key: str, bucket_name: str):
-        super().__init__(app)
+        self.app = app
         self.minio_url = minio_url
         self.access_key = access_key
         self.secret_key = secret_key
@@ -68,7 +66,12 @@ class ContextMinioMiddleware(BaseHTTPMiddleware):
             client.make_bucket(bucket_name)
         global _bucket
         _bucket = bucket_name
-        _client.set(client)
-
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
-        return await call_next(request)
+        self.client = client
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # the client is shared, setting it per request makes it visible to every request context
+        token = _client.set(self.client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _client.reset(token)
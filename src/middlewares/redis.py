@@ -1,10 +1,10 @@
 from contextvars import ContextVar
 from typing import Optional
 
-from redis.asyncio import Redis, from_url
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
-from starlette.types import ASGIApp
+from redis.asyncio import Redis
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from middlewares.timing import TimedRedis
 
 
 class MissingClientError(Exception):
@@ -23,21 +23,33 @@ class RedisNotInitialisedError(Exception):
         super().__init__(msg)
 
 
+class _LazyClient:
+    """Holds the client of a context, the client is only created when it is first requested."""
+
+    def __init__(self):
+        self.client: Optional[Redis] = None
+
+    def get(self) -> Redis:
+        if self.client is None:
+            self.client = _redis.client()
+        return self.client
+
+
 _redis: Optional[Redis] = None
-_client: ContextVar[Optional[Redis]] = ContextVar("_client", default=None)
+_client: ContextVar[Optional[_LazyClient]] = ContextVar("_client", default=None)
 
 
 def get_ctx_client() -> Redis:
-    """Return an instance of Client local to the current async context."""
+    """Return an instance of Client local to the current async context, created on first use."""
 
     if _redis is None:
         raise RedisNotInitialisedError
 
-    client = _client.get()
-    if client is None:
+    lazy_client = _client.get()
+    if lazy_client is None:
         raise MissingClientError
 
-    return client
+    return lazy_client.get()
 
 
 class ContextClient:
@@ -47,20 +59,23 @@ class ContextClient:
     async def __aenter__(self):
         if _redis is None:
             raise RedisNotInitialisedError
-        # get single connection client
-        self.token = _client.set(_redis.client())
-        return type(self)
+        self.lazy_client = _LazyClient()
+        self.token = _client.set(self.lazy_client)
+        return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        client = _client.get()
-        await client.close(close_connection_pool=False)
-        _client.reset(self.token)
+        try:
+            if self.lazy_client.client is not None:
+                await self.lazy_client.client.close(close_connection_pool=False)
+        finally:
+            self.lazy_client.client = None
+            _client.reset(self.token)
 
 
-class ContextRedisMiddleware(BaseHTTPMiddleware):
+class ContextRedisMiddleware:
     def __init__(self, app: ASGIApp, url: str):
-        super().__init__(app)
-        redis = from_url(
+        self.app = app
+        redis = TimedRedis.from_url(
             url,
             max_connections=10,
             encoding="utf8",
@@ -69,6 +84,10 @@ class ContextRedisMiddleware(BaseHTTPMiddleware):
         global _redis
         _redis = redis
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         async with ContextClient():
-            return await call_next(request)
+            await self.app(scope, receive, send)
@@ -0,0 +1,169 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.settings import settings
+
+
+@dataclass
+class RequestStats:
+    """Work done by the database, Redis and the JSON encoder while serving a request."""
+
+    route: Optional[str] = None
+    statements: int = 0
+    rows: int = 0
+    db_seconds: float = 0.0
+    redis_commands: int = 0
+    redis_seconds: float = 0.0
+    serialization_seconds: float = 0.0
+    statement_budget: int = settings.SQL_STATEMENT_BUDGET
+    statement_counts: Counter = field(default_factory=Counter)
+
+
+_stats: ContextVar[Optional[RequestStats]] = ContextVar("_stats", default=None)
+
+
+def get_ctx_stats() -> Optional[RequestStats]:
+    """Return the statistics of the current request, None outside of a request."""
+    return _stats.get()
+
+
+# the start time is kept on the execution context, a statement that fails leaves nothing behind on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._timing_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._timing_start
+    if (stats := _stats.get()) is None or not conn.get_execution_options().get("instrument", True):
+        return
+    stats.statements += 1
+    stats.db_seconds += elapsed
+    stats.statement_counts[statement] += 1
+    stats.rows += _row_count(cursor)
+
+
+def _row_count(cursor) -> int:
+    # the async adapters report no rowcount for reads, their cursors hold the rows they already fetched
+    if cursor.description is not None and isinstance(rows := getattr(cursor, "_rows", None), list):
+        return len(rows)
+    return max(cursor.rowcount, 0)
+
+
+def instrument_engine(engine: AsyncEngine):
+    """
+    Record the statements executed by `engine`, and by the engines derived from it, in the request stats.
+    Connections with the `instrument=False` execution option are left out.
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _record_redis(commands: int, start: float):
+    if stats := _stats.get():
+        stats.redis_commands += commands
+        stats.redis_seconds += time.perf_counter() - start
+
+
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        commands, start = len(self.command_stack), time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            _record_redis(commands, start)
+
+
+class TimedRedis(Redis):
+    """Redis client recording its round trips in the request stats."""
+
+    async def execute_command(self, *args: Any, **options: Any):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _record_redis(1, start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response recording the time spent encoding its body in the request stats."""
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            if stats := _stats.get():
+                stats.serialization_seconds += time.perf_counter() - start
+
+
+def _server_timing(stats: RequestStats, total: float) -> str:
+    return ", ".join(
+        [
+            f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} statements, {stats.rows} rows"',
+            f'redis;dur={stats.redis_seconds * 1000:.2f};desc="{stats.redis_commands} commands"',
+            f"serialization;dur={stats.serialization_seconds * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ]
+    )
+
+
+def _report(stats: RequestStats):
+    for statement, count in stats.statement_counts.items():
+        if count >= settings.SQL_REPEATED_STATEMENT_THRESHOLD:
+            shape = " ".join(statement.split())[:200]
+            logging.warning(f"Possible N+1 on {stats.route}, executed {count} times: {shape}")
+    if stats.statements > stats.statement_budget:
+        logging.warning(
+            f"Statement budget exceeded on {stats.route}: {stats.statements} statements for a budget of "
+            f"{stats.statement_budget}, {stats.rows} rows in {stats.db_seconds * 1000:.1f}ms"
+        )
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the statements, rows and time spent in the database, in Redis and in JSON encoding for each
+    request, and reports them in a `Server-Timing` header. Once the request is served, statements repeated
+    SQL_REPEATED_STATEMENT_THRESHOLD times (a likely N+1) and routes going over their statement budget,
+    see the `statement_budget` dependency, are logged.
+    Must be the outermost of the context middlewares so the commit is part of the measure.
+    """
+
+    def __init__(self, app: ASGIApp, header: bool = True):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(route=f"{scope['method']} {scope['path']}")
+        token = _stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            if self.header and message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", _server_timing(stats, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stats.reset(token)
+            _report(stats)
@@ -22,7 +22,7 @@ class GroupBase(SQLModel):
 
 
 class Group(BaseUUIDModel, GroupBase, table=True):
-    scopes: List[Scope] = Relationship(link_model=GroupScopeLink, sa_relationship_kwargs={"lazy": "selectin"})
+    scopes: List[Scope] = Relationship(link_model=GroupScopeLink, sa_relationship_kwargs={"lazy": "raise"})
     users: List[User] = Relationship(
-        back_populates="groups", link_model=GroupUserLink, sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="groups", link_model=GroupUserLink, sa_relationship_kwargs={"lazy": "raise"}
     )
@@ -26,6 +26,6 @@ class ImageMedia(BaseUUIDModel, ImageMediaBase, table=True):
     media_id: Optional[UUID] = Field(foreign_key="Media.id")
     media: Optional[Media] = Relationship(
         sa_relationship_kwargs={
-            "lazy": "selectin",
+            "lazy": "raise",
         }
     )
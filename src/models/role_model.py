@@ -20,7 +20,7 @@ class RoleBase(SQLModel):
 
 
 class Role(BaseUUIDModel, RoleBase, table=True):
-    scopes: List[Scope] = Relationship(link_model=RoleScopeLink, sa_relationship_kwargs={"lazy": "selectin"})
+    scopes: List[Scope] = Relationship(link_model=RoleScopeLink, sa_relationship_kwargs={"lazy": "raise"})
     users: List[User] = Relationship(
-        back_populates="role", sa_relationship_kwargs={"lazy": "selectin", "foreign_keys": "User.role_id"}
+        back_populates="role", sa_relationship_kwargs={"lazy": "raise", "foreign_keys": "User.role_id"}
     )
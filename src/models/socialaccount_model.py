@@ -24,7 +24,7 @@ class SocialAccountBase(SQLModel):
 
 class SocialAccount(BaseUUIDModel, SocialAccountBase, table=True):
     __table_args__ = (UniqueConstraint("user_id", "provider"),)
-    user: User = Relationship(sa_relationship_kwargs={"lazy": "selectin"})  # noqa: F821
+    user: User = Relationship(sa_relationship_kwargs={"lazy": "raise"})  # noqa: F821
 
 
 # class SocialEngagementBase(SQLModel):
@@ -3,7 +3,7 @@ from typing import List, Optional
 from uuid import UUID
 
 from pydantic import EmailStr
-from sqlmodel import VARCHAR, Column, DateTime, Field, Relationship, SQLModel
+from sqlmodel import VARCHAR, Column, DateTime, Field, Integer, Relationship, SQLModel
 
 from models.base_uuid_model import BaseUUIDModel
 from models.links_model import GroupUserLink
@@ -32,32 +32,34 @@ class UserBase(SQLModel):
 
 class User(BaseUUIDModel, UserBase, table=True):
     hashed_password: Optional[str]
+    # incremented by CRUDBase.update, which only writes the version it read
+    version: int = Field(default=1, sa_column=Column(Integer, nullable=False, default=1, server_default="1"))
     role: Optional["Role"] = Relationship(  # noqa: F821
-        back_populates="users", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="users", sa_relationship_kwargs={"lazy": "raise"}
     )
-    image: Optional["ImageMedia"] = Relationship(sa_relationship_kwargs={"lazy": "selectin"})  # noqa: F821
+    image: Optional["ImageMedia"] = Relationship(sa_relationship_kwargs={"lazy": "raise"})  # noqa: F821
     groups: List["Group"] = Relationship(  # noqa: F821
         back_populates="users",
         link_model=GroupUserLink,
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
     wallets: List["Wallet"] = Relationship(  # noqa: F821
         back_populates="user",
         sa_relationship_kwargs={
-            "lazy": "selectin",
+            "lazy": "raise",
             "foreign_keys": "Wallet.user_id",
         },
     )
     primary_wallet: Optional["Wallet"] = Relationship(  # noqa: F821
         sa_relationship_kwargs={
-            "lazy": "selectin",
+            "lazy": "raise",
             "foreign_keys": "User.primary_wallet_id",
         },
     )
     social_accounts: List["SocialAccount"] = Relationship(  # noqa: F821
         back_populates="user",
         sa_relationship_kwargs={
-            "lazy": "selectin",
+            "lazy": "raise",
             "foreign_keys": "SocialAccount.user_id",
         },
     )
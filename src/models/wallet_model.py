@@ -19,7 +19,7 @@ class Wallet(BaseUUIDModel, WalletBase, table=True):
     user: User = Relationship(
         back_populates="wallets",
         sa_relationship_kwargs={
-            "lazy": "selectin",
+            "lazy": "raise",
             "foreign_keys": "Wallet.user_id",
         },
     )  # noqa: F821
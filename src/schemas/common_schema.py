@@ -1,5 +1,6 @@
 from datetime import datetime
 from enum import Enum
+from importlib.util import find_spec
 from typing import List, Optional, Union
 
 from fastapi import Body, Query
@@ -17,6 +18,21 @@ class IOrderEnum(str, Enum):
     desc = "desc"
 
 
+class ICountStrategyEnum(str, Enum):
+    exact = "exact"
+    estimated = "estimated"
+    cached = "cached"
+    none = "none"
+
+
+class IExportFormatEnum(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    # pyarrow is optional, it has no wheels for the alpine image
+    if find_spec("pyarrow") is not None:
+        parquet = "parquet"
+
+
 class FilterQuery(BaseModel):
     filter_by: Optional[str] = Query(None)
     min: Union[float, datetime, str, None] = Query(None)
@@ -34,6 +50,11 @@ class FilterQuery(BaseModel):
     order: Optional[IOrderEnum] = Query(IOrderEnum.asc)
 
 
+class CursorQuery(BaseModel):
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, the first page if not set")
+    size: int = Query(50, ge=1, le=100, description="page size")
+
+
 class GroupQuery(BaseModel):
     group_by: List[str] = Body([], description="group by keys")
     avg: List[str] = Body([], description="compute avg for these columns")
@@ -17,7 +17,7 @@ class IGroupRead(GroupBase):
 
     @validator("scopes", pre=True)
     def validate_scopes(cls, value, values) -> List[str]:
-        return [scope.name for scope in values["scopes"]]
+        return [scope.name for scope in value]
 
 
 # All fields are optional
@@ -1,6 +1,7 @@
 from typing import Any, Dict, Generic, List, Optional, TypeVar, Union
 
 from fastapi_pagination import Page
+from fastapi_pagination.types import GreaterEqualZero
 from pydantic.generics import GenericModel
 
 DataType = TypeVar("DataType")
@@ -19,10 +20,39 @@ class IResponseList(GenericModel, Generic[T]):
     data: Optional[List[T]]
 
 
+class IPage(Page[T], Generic[T]):
+    # None when the route doesn't count, see `count_strategy`
+    total: Optional[GreaterEqualZero]
+    has_next: bool = False
+    total_estimated: bool = False
+
+    class Config:
+        orm_mode = True
+        # keeps the items as ORM objects until the response model reads them, relationships included
+        read_with_orm_mode = True
+
+
 class IResponsePage(GenericModel, Generic[T]):
     message: str = ""
     meta: Dict = {}
-    data: Page[T]
+    data: IPage[T]
+
+
+class ICursorPage(GenericModel, Generic[T]):
+    items: List[T]
+    size: int
+    next_cursor: Optional[str]
+
+    class Config:
+        orm_mode = True
+        # keeps the items as ORM objects until the response model reads them, relationships included
+        read_with_orm_mode = True
+
+
+class IResponseCursorPage(GenericModel, Generic[T]):
+    message: str = ""
+    meta: Dict = {}
+    data: ICursorPage[T]
 
 
 def create_response(
@@ -23,4 +23,4 @@ class IRoleRead(RoleBase):
 
     @validator("scopes", pre=True)
     def validate_scopes(cls, value, values) -> List[str]:
-        return [scope.name for scope in values["scopes"]]
+        return [scope.name for scope in value]
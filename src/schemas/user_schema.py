@@ -29,11 +29,12 @@ class IUserCreate(UserBase):
 # All these fields are optional
 @optional
 class IUserUpdate(UserBase):
-    pass
+    version: int
 
 
 class IUserRead(UserBase):
     id: UUID
+    version: Optional[int]
     role: Optional[str]
     groups: Optional[List[str]]
     image: Optional[IImageMediaRead]
@@ -69,6 +70,15 @@ class IUserReadBasic(UserBase):
     image: Optional[IImageMediaRead]
 
 
+class IUserPrincipal(BaseModel):
+    """Identity of an authenticated user, enough for access checks without loading the user"""
+
+    id: UUID
+    is_active: bool
+    role: Optional[str]
+    groups: List[str] = []
+
+
 class IUserStatus(str, Enum):
     active = "active"
     inactive = "inactive"
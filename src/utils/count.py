@@ -0,0 +1,106 @@
+from contextvars import ContextVar
+from typing import Any, Optional, Tuple
+
+import orjson
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import noload
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.sql.traversals import InternalTraversal
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select
+
+from core.settings import settings
+from schemas.common_schema import ICountStrategyEnum
+from utils.ttl_cache import TTLCache
+
+_count_strategy: ContextVar[Optional[ICountStrategyEnum]] = ContextVar("_count_strategy", default=None)
+_counts: TTLCache[Tuple[str, str], int] = TTLCache(
+    settings.PAGINATION_COUNT_CACHE_SIZE, settings.PAGINATION_COUNT_CACHE_TTL
+)
+_default_strategy = ICountStrategyEnum(settings.PAGINATION_COUNT_STRATEGY)
+
+
+def set_count_strategy(strategy: Optional[ICountStrategyEnum]):
+    """Count strategy of the paginated listings of the current request."""
+    _count_strategy.set(strategy)
+
+
+def get_ctx_count_strategy() -> ICountStrategyEnum:
+    """Count strategy of the current request, PAGINATION_COUNT_STRATEGY when the route doesn't set one."""
+    return _count_strategy.get() or _default_strategy
+
+
+class Explain(Executable, ClauseElement):
+    """`EXPLAIN (FORMAT JSON)` of a statement, the statement is planned but not run."""
+
+    inherit_cache = True
+    _traverse_internals = [("statement", InternalTraversal.dp_clauseelement)]
+
+    def __init__(self, statement: ClauseElement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler: Any, **kw: Any) -> str:
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+
+async def _estimate(db_session: AsyncSession, query: Select) -> Optional[int]:
+    # run on the connection, the session would count these statements that are not selects as writes
+    connection = await db_session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+
+    froms = query.get_final_froms()
+    if query.whereclause is None and len(froms) == 1 and isinstance(froms[0], Table) and not query._group_by_clauses:
+        # the whole table, the row count the planner keeps up to date on VACUUM and ANALYZE. The table
+        # names are mixed case, regclass needs them quoted
+        response = await connection.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": connection.dialect.identifier_preparer.format_table(froms[0])},
+        )
+        estimate = response.scalar_one_or_none()
+        # -1 until the table is first analyzed
+        return estimate if estimate is not None and estimate >= 0 else None
+
+    plan = (await connection.execute(Explain(query))).scalar_one()
+    if isinstance(plan, (str, bytes)):
+        plan = orjson.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_rows(
+    db_session: AsyncSession, query: Select, strategy: ICountStrategyEnum = ICountStrategyEnum.exact
+) -> Tuple[Optional[int], bool]:
+    """
+    Number of rows returned by `query` and whether it is an estimate, following `strategy`:
+    * `exact`: `COUNT(*)` over the query
+    * `estimated`: the planner estimate, `pg_class.reltuples` for a whole table or the EXPLAIN row estimate
+      of a filtered query. Estimates under PAGINATION_EXACT_COUNT_BELOW, and estimates on other databases,
+      fall back to an exact count
+    * `cached`: an exact count reused for PAGINATION_COUNT_CACHE_TTL seconds by the worker
+    * `none`: no count, the total is None
+    """
+    if strategy == ICountStrategyEnum.none:
+        return None, False
+
+    query = query.order_by(None).options(noload("*"))
+    if strategy == ICountStrategyEnum.estimated:
+        estimate = await _estimate(db_session, query)
+        if estimate is not None and estimate >= settings.PAGINATION_EXACT_COUNT_BELOW:
+            return estimate, True
+
+    count_query = select(func.count()).select_from(query.subquery())
+    key = None
+    if strategy == ICountStrategyEnum.cached:
+        compiled = count_query.compile(dialect=(await db_session.connection()).dialect)
+        key = (compiled.string, repr(sorted(compiled.params.items())))
+        if (total := _counts.get(key)) is not None:
+            return total, False
+
+    total = (await db_session.execute(count_query)).scalar_one()
+    if key is not None:
+        _counts.set(key, total)
+    return total, False
@@ -0,0 +1,17 @@
+import base64
+from typing import Any, List
+
+import orjson
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque cursor holding `values`, the sort key of the last row of a page."""
+    return base64.urlsafe_b64encode(orjson.dumps(values, default=str)).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Values held by a cursor made by `encode_cursor`, raises ValueError if it is malformed."""
+    values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
@@ -0,0 +1,129 @@
+import csv
+import io
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Integer
+from sqlalchemy.engine import Row
+
+from schemas.common_schema import IExportFormatEnum
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only the parquet export needs it, see IExportFormatEnum
+    pyarrow = None
+
+MEDIA_TYPES = {
+    IExportFormatEnum.ndjson: "application/x-ndjson",
+    IExportFormatEnum.csv: "text/csv",
+}
+
+Partitions = AsyncIterator[Sequence[Row]]
+
+
+async def _ndjson(columns: List[Column], partitions: Partitions) -> AsyncIterator[bytes]:
+    names = [column.key for column in columns]
+    async for rows in partitions:
+        yield b"".join(orjson.dumps(dict(zip(names, row)), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+async def _csv(columns: List[Column], partitions: Partitions) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in columns])
+    async for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # the header of an empty export
+        yield buffer.getvalue().encode()
+
+
+class _ParquetSink(io.RawIOBase):
+    """Write-only file handing out what was written since the last `take`, the writer only needs `tell`."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow_field(column: Column) -> Tuple[Any, Optional[Callable[[Any], Any]]]:
+    if isinstance(column.type, Boolean):
+        return pyarrow.field(column.key, pyarrow.bool_()), None
+    if isinstance(column.type, Integer):
+        return pyarrow.field(column.key, pyarrow.int64()), None
+    if isinstance(column.type, Float):
+        return pyarrow.field(column.key, pyarrow.float64()), None
+    if isinstance(column.type, DateTime):
+        return pyarrow.field(column.key, pyarrow.timestamp("us", tz="UTC" if column.type.timezone else None)), None
+    if isinstance(column.type, Date):
+        return pyarrow.field(column.key, pyarrow.date32()), None
+    # uuids, enums and the other types are exported as strings
+    return pyarrow.field(column.key, pyarrow.string()), str
+
+
+def _convert(values: Sequence[Any], converter: Optional[Callable[[Any], Any]]) -> Sequence[Any]:
+    if converter is None:
+        return values
+    return [None if value is None else converter(value) for value in values]
+
+
+async def _parquet(columns: List[Column], partitions: Partitions) -> AsyncIterator[bytes]:
+    fields, converters = zip(*(_arrow_field(column) for column in columns))
+    schema = pyarrow.schema(fields)
+    sink = _ParquetSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    async for rows in partitions:
+        # one row group per partition
+        arrays = [
+            pyarrow.array(_convert(values, converter), type=field.type)
+            for field, converter, values in zip(fields, converters, zip(*rows))
+        ]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+_ENCODERS = {
+    IExportFormatEnum.ndjson: _ndjson,
+    IExportFormatEnum.csv: _csv,
+}
+if pyarrow is not None:
+    # the format is only offered when pyarrow is installed
+    MEDIA_TYPES[IExportFormatEnum.parquet] = "application/vnd.apache.parquet"
+    _ENCODERS[IExportFormatEnum.parquet] = _parquet
+
+
+def export_response(
+    format: IExportFormatEnum, name: str, columns: List[Column], partitions: Partitions
+) -> StreamingResponse:
+    """
+    Streams the rows of `partitions` as an attachment `name`.`format`, each partition is encoded and sent
+    as soon as it is read so neither the server nor the client wait for the whole export.
+    """
+    return StreamingResponse(
+        _ENCODERS[format](columns, partitions),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format.value}"'},
+    )
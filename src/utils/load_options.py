@@ -0,0 +1,26 @@
+from typing import Any, List, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+
+def schema_load_options(model: Type[Any], schema: Type[BaseModel], _path: Tuple[Type[Any], ...] = ()) -> List[Any]:
+    """
+    Loader options for the relationships of `model` that `schema` reads: a schema field named after a
+    relationship loads it, with the options of the nested schema when the field is a schema itself.
+    Many-to-one relationships are joined, collections are loaded with a second SELECT ... IN query.
+    """
+    relationships = inspect(model).relationships
+    options = []
+    for name, field in schema.__fields__.items():
+        if name not in relationships:
+            continue
+        relationship = relationships[name]
+        attribute = getattr(model, name)
+        loader = selectinload(attribute) if relationship.uselist else joinedload(attribute)
+        target = relationship.mapper.class_
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel) and target not in _path:
+            loader = loader.options(*schema_load_options(target, field.type_, (*_path, model)))
+        options.append(loader)
+    return options
@@ -1,36 +1,67 @@
-from datetime import timedelta
-from uuid import UUID
+import hashlib
+import hmac
+import re
+import secrets
+import time
 
 from redis.asyncio import Redis
 
+from core.settings import settings
 from middlewares.redis import get_ctx_client
 
+# hex digits only, SIWE nonces must be alphanumeric
+_RANDOM_LENGTH = 16
+_EXPIRES_LENGTH = 8
+_SIGNATURE_LENGTH = 16
+_NONCE_LENGTH = _RANDOM_LENGTH + _EXPIRES_LENGTH + _SIGNATURE_LENGTH
+_NONCE_PATTERN = re.compile(r"^Nonce: ([0-9a-f]+)$", re.MULTILINE)
 
-def _gen_nonce_key(session_id: UUID) -> str:
-    return f"session:{session_id}:nonce"
+_key = hmac.new(settings.SECRET_KEY.encode(), b"siwe-nonce", hashlib.sha256).digest()
 
 
-async def set_nonce(
-    session_id: UUID,
-    nonce: str,
-    expire_time: timedelta,
-    redis_client: Redis | None = None,
-) -> str:
-    redis_client = redis_client or get_ctx_client()
-    nonce_key = _gen_nonce_key(session_id)
-    await redis_client.set(nonce_key, nonce)
-    await redis_client.expire(nonce_key, expire_time)
-    return nonce_key
+def _sign(payload: str) -> str:
+    return hmac.new(_key, payload.encode(), hashlib.sha256).hexdigest()[:_SIGNATURE_LENGTH]
 
 
-async def get_nonce(session_id: UUID, redis_client: Redis | None = None) -> str | None:
-    redis_client = redis_client or get_ctx_client()
-    nonce_key = _gen_nonce_key(session_id)
-    valid_nonce = await redis_client.get(nonce_key)
-    return valid_nonce
+def _gen_nonce_key(nonce: str) -> str:
+    return f"nonce:{nonce}"
+
+
+def create_nonce(expire_seconds: int = settings.SIWE_NONCE_EXPIRE_SECONDS) -> str:
+    """
+    Returns a nonce carrying its own expiration and signature, issuing it needs no storage
+    """
+    payload = secrets.token_hex(_RANDOM_LENGTH // 2) + f"{int(time.time()) + expire_seconds:0{_EXPIRES_LENGTH}x}"
+    return payload + _sign(payload)
+
+
+def nonce_expires_in(nonce: str) -> int:
+    """
+    Returns the remaining lifetime of a nonce in seconds, 0 if it is expired, malformed or was not issued by us
+    """
+    if len(nonce) != _NONCE_LENGTH:
+        return 0
+    payload, signature = nonce[:-_SIGNATURE_LENGTH], nonce[-_SIGNATURE_LENGTH:]
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return 0
+    try:
+        expires = int(payload[_RANDOM_LENGTH:], 16)
+    except ValueError:
+        return 0
+    return max(expires - int(time.time()), 0)
+
+
+def extract_nonce(message: str) -> str | None:
+    """
+    Reads the nonce of a SIWE message without parsing the whole message
+    """
+    match = _NONCE_PATTERN.search(message)
+    return match.group(1) if match else None
 
 
-async def delete_nonce(session_id: UUID, redis_client: Redis | None = None):
+async def claim_nonce(nonce: str, expire_seconds: int, redis_client: Redis | None = None) -> bool:
+    """
+    Marks a nonce as used until it expires, returns False if it was already used
+    """
     redis_client = redis_client or get_ctx_client()
-    nonce_key = _gen_nonce_key(session_id)
-    await redis_client.delete(nonce_key)
+    return bool(await redis_client.set(_gen_nonce_key(nonce), 1, ex=max(expire_seconds, 1), nx=True))
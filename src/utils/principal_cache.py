@@ -0,0 +1,95 @@
+import logging
+from typing import Awaitable, Callable, Optional
+from uuid import UUID
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.settings import settings
+from middlewares.redis import get_ctx_client
+from schemas.user_schema import IUserPrincipal
+from utils.ttl_cache import TTLCache
+
+PrincipalLoader = Callable[[UUID | str], Awaitable[Optional[IUserPrincipal]]]
+
+_GENERATION_KEY = "principal:generation"
+
+
+def _gen_version_key(user_id: UUID | str) -> str:
+    return f"principal:{user_id}:version"
+
+
+def _gen_principal_key(user_id: UUID | str) -> str:
+    return f"principal:{user_id}"
+
+
+class PrincipalCache:
+    """
+    Two level cache of user principals.
+
+    Redis holds each principal next to a version counter that is incremented whenever the user changes.
+    A cached principal is only served while its version is the current one, and while the generation
+    shared by all the principals is the one it was cached with. The generation is incremented when a group
+    or a role changes, as any number of principals hold its name. All three are read in one round trip.
+    In front of Redis, each worker keeps principals for `local_ttl` seconds: the local copy of a worker
+    that did not make the change can be stale for that long.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, local_ttl: float):
+        self.ttl = ttl
+        self._local: TTLCache[str, IUserPrincipal] = TTLCache(maxsize, local_ttl)
+
+    async def get(
+        self,
+        user_id: UUID | str,
+        loader: PrincipalLoader,
+        redis_client: Redis | None = None,
+    ) -> Optional[IUserPrincipal]:
+        if principal := self._local.get(str(user_id)):
+            return principal
+
+        redis_client = redis_client or get_ctx_client()
+        try:
+            generation, version, blob = await redis_client.mget(
+                _GENERATION_KEY, _gen_version_key(user_id), _gen_principal_key(user_id)
+            )
+        except RedisError as e:
+            logging.warning(f"Principal cache unavailable: {e}")
+            return await loader(user_id)
+
+        tag = [int(generation or 0), int(version or 0)]
+        if blob and (cached := orjson.loads(blob)).get("tag") == tag:
+            principal = IUserPrincipal.parse_obj(cached["principal"])
+            self._local.set(str(user_id), principal)
+            return principal
+
+        # tagged with the counters read before loading, a change committed meanwhile makes this entry a miss
+        principal = await loader(user_id)
+        if principal is None:
+            return None
+        blob = orjson.dumps({"tag": tag, "principal": principal.dict()}, default=str)
+        try:
+            await redis_client.set(_gen_principal_key(user_id), blob, ex=self.ttl)
+        except RedisError as e:
+            logging.warning(f"Principal cache unavailable: {e}")
+        self._local.set(str(user_id), principal)
+        return principal
+
+    async def invalidate(self, user_id: UUID | str, redis_client: Redis | None = None):
+        self._local.pop(str(user_id))
+        redis_client = redis_client or get_ctx_client()
+        # the counter never expires, a reset counter could match a principal cached before the reset
+        await redis_client.incr(_gen_version_key(user_id))
+
+    async def invalidate_all(self, redis_client: Redis | None = None):
+        self._local.clear()
+        redis_client = redis_client or get_ctx_client()
+        await redis_client.incr(_GENERATION_KEY)
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    local_ttl=settings.PRINCIPAL_CACHE_LOCAL_TTL,
+)
@@ -0,0 +1,157 @@
+import hashlib
+import ipaddress
+import logging
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.settings import settings
+from exceptions.common_exception import TooManyRequestsException
+from middlewares.redis import get_ctx_client
+
+# KEYS[i] window of each identifier
+# ARGV[1] now ms, ARGV[2] window ms, ARGV[3] member, ARGV[3 + i] limit of KEYS[i]
+# Returns 0 when the attempt is recorded, otherwise the ms to wait before the oldest attempt leaves the window
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local wait = 0
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        wait = math.max(wait, tonumber(oldest[2]) + window - now)
+    end
+end
+if wait > 0 then
+    return wait
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+
+_trusted_proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.RATE_LIMIT_TRUSTED_PROXIES]
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_proxies)
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    Address of the client. Behind RATE_LIMIT_TRUSTED_PROXIES, it is the last X-Forwarded-For hop that is not a
+    trusted proxy: the hops before it were written by the client and can be forged.
+    """
+    if request.client is None:
+        return None
+    address = request.client.host
+    if not _is_trusted_proxy(address):
+        return address
+    for hop in reversed(request.headers.get("x-forwarded-for", "").split(",")):
+        address = hop.strip() or address
+        if not _is_trusted_proxy(address):
+            break
+    return address
+
+
+class RateLimiter:
+    """
+    Sliding window limiter shared by all workers through Redis.
+
+    Used as a route dependency, it counts attempts per client IP, see `client_ip`, and, when `account_field` is
+    set, per account read from the query, form or JSON body. Declared in the route `dependencies`, it runs before
+    the endpoint parameters are resolved, so rejected requests never reach the database or the password hasher.
+    An attempt is only recorded when every window accepts it, routes `reset` the account window on success so
+    only failed attempts lock an account. If Redis is unavailable requests are let through.
+    """
+
+    def __init__(
+        self,
+        scope: str,
+        account_field: Optional[str] = None,
+        ip_times: int = settings.RATE_LIMIT_IP_TIMES,
+        account_times: int = settings.RATE_LIMIT_ACCOUNT_TIMES,
+        seconds: int = settings.RATE_LIMIT_WINDOW_SECONDS,
+    ):
+        self.scope = scope
+        self.account_field = account_field
+        self.ip_times = ip_times
+        self.account_times = account_times
+        self.seconds = seconds
+
+    def _ip_key(self, ip: str) -> str:
+        return f"ratelimit:{self.scope}:ip:{ip}"
+
+    def _account_key(self, account: str) -> str:
+        digest = hashlib.sha256(account.strip().lower().encode()).hexdigest()[:32]
+        return f"ratelimit:{self.scope}:account:{digest}"
+
+    async def _get_account(self, request: Request) -> Optional[str]:
+        if account := request.query_params.get(self.account_field):
+            return account
+        try:
+            if request.headers.get("content-type", "").startswith("application/json"):
+                body = await request.json()
+                account = body.get(self.account_field) if isinstance(body, dict) else None
+            else:
+                account = (await request.form()).get(self.account_field)
+        except Exception:
+            return None
+        return account if isinstance(account, str) and account else None
+
+    async def hit(self, ip: Optional[str] = None, account: Optional[str] = None, redis_client: Redis | None = None):
+        """
+        Records an attempt for `ip` and `account`, raises TooManyRequestsException if one of them is over the limit
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        keys: List[str] = []
+        limits: List[int] = []
+        if ip:
+            keys.append(self._ip_key(ip))
+            limits.append(self.ip_times)
+        if account:
+            keys.append(self._account_key(account))
+            limits.append(self.account_times)
+        if not keys:
+            return
+
+        redis_client = redis_client or get_ctx_client()
+        script = redis_client.register_script(_SLIDING_WINDOW_SCRIPT)
+        try:
+            wait_ms = await script(
+                keys=keys,
+                args=[int(time.time() * 1000), self.seconds * 1000, uuid.uuid4().hex, *limits],
+                client=redis_client,
+            )
+        except RedisError as e:
+            logging.warning(f"Rate limiter {self.scope} unavailable: {e}")
+            return
+        if wait_ms:
+            raise TooManyRequestsException(retry_after=-(-int(wait_ms) // 1000))
+
+    async def reset(self, account: str, redis_client: Redis | None = None):
+        """Clears the attempts of `account`, after it proved its credentials"""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        redis_client = redis_client or get_ctx_client()
+        try:
+            await redis_client.delete(self._account_key(account))
+        except RedisError as e:
+            logging.warning(f"Rate limiter {self.scope} unavailable: {e}")
+
+    async def __call__(self, request: Request):
+        account = await self._get_account(request) if self.account_field else None
+        await self.hit(ip=client_ip(request), account=account)
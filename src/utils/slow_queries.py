@@ -0,0 +1,144 @@
+import logging
+import random
+import re
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.settings import settings
+from middlewares.timing import get_ctx_stats
+from utils.tasks import create_background_task
+from utils.ttl_cache import TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+# expanded IN lists render one placeholder per value, the shape keeps a single one
+_IN_LIST = re.compile(r"IN \((?:%s|\$\d+|\?)(?:, (?:%s|\$\d+|\?))*\)", re.IGNORECASE)
+
+
+def normalize(statement: str) -> str:
+    """Shape of a statement: whitespace collapsed and IN lists folded, whatever the number of values."""
+    return _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+@dataclass
+class SlowQuery:
+    shape: str
+    duration_ms: float
+    route: Optional[str]
+    parameters: List[str] = field(default_factory=list)
+    at: datetime = field(default_factory=datetime.utcnow)
+    plan: Optional[Any] = None
+
+
+class SlowQueryLog:
+    """
+    Ring buffer of the statements that ran longer than `threshold_ms`, with their route and parameters.
+    A sample of the slow SELECT statements is run again in the background with
+    `EXPLAIN (ANALYZE, BUFFERS)`, in a READ ONLY transaction, at most once per shape every
+    `explain_interval` seconds. Only SELECT parameters are kept, write parameters may hold secrets.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        threshold_ms: float,
+        explain_rate: float,
+        explain_interval: float,
+        explain_timeout_ms: int,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.entries: Deque[SlowQuery] = deque(maxlen=maxsize)
+        self._explained: TTLCache[str, bool] = TTLCache(maxsize, explain_interval)
+
+    def instrument(self, engine: AsyncEngine):
+        """Record the slow statements of `engine`, and of the engines derived from it."""
+        explain_engine = engine.execution_options(instrument=False)
+
+        # see _before_cursor_execute in middlewares.timing, the start time lives on the execution context
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._slow_query_start = time.perf_counter()
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            duration_ms = (time.perf_counter() - context._slow_query_start) * 1000
+            if duration_ms >= self.threshold_ms and conn.get_execution_options().get("instrument", True):
+                self.record(explain_engine, statement, parameters, context, executemany, duration_ms)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+    def record(
+        self,
+        explain_engine: AsyncEngine,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+        duration_ms: float,
+    ):
+        compiled = getattr(context, "compiled", None)
+        is_select = compiled is not None and compiled.statement is not None and compiled.statement.is_select
+        stats = get_ctx_stats()
+        entry = SlowQuery(shape=normalize(statement), duration_ms=round(duration_ms, 2), route=stats and stats.route)
+        if is_select and not executemany:
+            entry.parameters = [repr(parameter)[:100] for parameter in parameters]
+        self.entries.append(entry)
+        logging.warning(f"Slow query ({duration_ms:.0f}ms) on {entry.route}: {entry.shape[:200]}")
+
+        if is_select and random.random() < self.explain_rate and self._explained.get(entry.shape) is None:
+            self._explained.set(entry.shape, True)
+            create_background_task(self.explain(explain_engine, entry, statement, parameters), name="explain")
+
+    async def explain(self, engine: AsyncEngine, entry: SlowQuery, statement: str, parameters: Any):
+        async with engine.connect() as connection:
+            transaction = await connection.begin()
+            try:
+                await connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+                await connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                result = await connection.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", tuple(parameters)
+                )
+                plan = result.scalar_one()
+                entry.plan = orjson.loads(plan) if isinstance(plan, (str, bytes)) else plan
+            finally:
+                await transaction.rollback()
+
+    def get_entries(self) -> List[Dict[str, Any]]:
+        """Slow statements, the most recent first."""
+        return [asdict(entry) for entry in reversed(self.entries)]
+
+    def get_shapes(self) -> List[Dict[str, Any]]:
+        """Slow statements grouped by shape, the shape with the most total time first."""
+        shapes: Dict[str, Dict[str, Any]] = {}
+        for entry in self.entries:
+            shape = shapes.setdefault(
+                entry.shape, {"shape": entry.shape, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "routes": set()}
+            )
+            shape["count"] += 1
+            shape["total_ms"] += entry.duration_ms
+            shape["max_ms"] = max(shape["max_ms"], entry.duration_ms)
+            shape["routes"].add(entry.route)
+        return sorted(
+            [
+                {**shape, "total_ms": round(shape["total_ms"], 2), "routes": sorted(filter(None, shape["routes"]))}
+                for shape in shapes.values()
+            ],
+            key=lambda shape: shape["total_ms"],
+            reverse=True,
+        )
+
+
+slow_query_log = SlowQueryLog(
+    maxsize=settings.SLOW_QUERY_LOG_SIZE,
+    threshold_ms=settings.SLOW_QUERY_MS,
+    explain_rate=settings.SLOW_QUERY_EXPLAIN_RATE,
+    explain_interval=settings.SLOW_QUERY_EXPLAIN_INTERVAL,
+    explain_timeout_ms=settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS,
+)
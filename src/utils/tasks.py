@@ -0,0 +1,22 @@
+import asyncio
+import logging
+from typing import Any, Coroutine, Set
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def _done(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and (exc := task.exception()):
+        logging.warning(f"Background task {task.get_name()} failed: {exc}")
+
+
+def create_background_task(coro: Coroutine[Any, Any, Any], name: str | None = None) -> asyncio.Task:
+    """
+    Runs `coro` after the current request without blocking it. A reference is kept until the task is done so
+    it can not be garbage collected, failures are logged.
+    """
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_done)
+    return task
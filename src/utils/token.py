@@ -1,44 +1,127 @@
+import hashlib
+import time
 from datetime import timedelta
 from enum import Enum
-from typing import Set
 from uuid import UUID
 
 from redis.asyncio import Redis
 
+from core.settings import settings
 from middlewares.redis import get_ctx_client
+from utils.token_cache import REVOKE_CHANNEL, token_cache
 
 
 class TokenType(str, Enum):
     JWT = "jwt"
 
+    def __str__(self) -> str:
+        return self.value
 
-def _gen_token_key(user_id: UUID, token_type: str) -> str:
-    return f"user:{user_id}:{token_type}"
+
+# Every key of a user shares the {user id} hash tag so the scripts run on one Redis Cluster slot.
+# KEYS[1] user index, KEYS[2] token key, KEYS[3...] token keys of the sessions in the index before the call
+# ARGV[1] digest, ARGV[2] ttl ms, ARGV[3] expiration ms, ARGV[4] now ms, ARGV[5] jti,
+# ARGV[6] max sessions, ARGV[7] revoke channel, ARGV[8] user id, ARGV[9...] jtis of KEYS[3...]
+_ISSUE_SCRIPT = """
+redis.call('SET', KEYS[2], ARGV[1], 'PX', ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+local extra = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[6])
+if extra > 0 then
+    local token_keys = {}
+    for i = 3, #KEYS do
+        token_keys[ARGV[i + 6]] = KEYS[i]
+    end
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, extra - 1)
+    for _, jti in ipairs(oldest) do
+        -- a session issued concurrently is not among the keys, it is evicted by a later call
+        if token_keys[jti] then
+            redis.call('DEL', token_keys[jti])
+            redis.call('ZREM', KEYS[1], jti)
+        end
+    end
+    redis.call('PUBLISH', ARGV[7], ARGV[8])
+end
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+redis.call('PEXPIREAT', KEYS[1], last[2])
+return math.max(extra, 0)
+"""
+
+# KEYS[1] user index, KEYS[2...] token keys of the sessions in the index
+# ARGV[1] revoke channel, ARGV[2] user id, ARGV[3...] jtis of KEYS[2...]
+_REVOKE_ALL_SCRIPT = """
+for i = 2, #KEYS do
+    redis.call('DEL', KEYS[i])
+    redis.call('ZREM', KEYS[1], ARGV[i + 1])
+end
+redis.call('PUBLISH', ARGV[1], ARGV[2])
+return #KEYS - 1
+"""
+
+
+def _gen_token_key(user_id: UUID, jti: str, token_type: str) -> str:
+    return f"{token_type}:{{{user_id}}}:{jti}"
+
+
+def _gen_user_tokens_key(user_id: UUID, token_type: str) -> str:
+    return f"user:{{{user_id}}}:{token_type}"
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
 
 
 async def set_token(
     user_id: UUID,
+    jti: str,
     token: str,
     token_type: TokenType,
     expire_time: timedelta,
     redis_client: Redis | None = None,
 ) -> str:
+    """
+    Registers a token under its jti and evicts the oldest sessions of the user above MAX_SESSIONS_PER_USER
+    """
     redis_client = redis_client or get_ctx_client()
-    token_key = _gen_token_key(user_id, token_type)
-    await redis_client.sadd(token_key, token)
-    await redis_client.expire(token_key, expire_time)
+    index_key = _gen_user_tokens_key(user_id, token_type)
+    token_key = _gen_token_key(user_id, jti, token_type)
+    now_ms = int(time.time() * 1000)
+    ttl_ms = int(expire_time.total_seconds() * 1000)
+    # the keys a script touches are declared, the sessions it may evict are read first
+    sessions = await redis_client.zrange(index_key, 0, -1)
+    script = redis_client.register_script(_ISSUE_SCRIPT)
+    evicted = await script(
+        keys=[index_key, token_key, *(_gen_token_key(user_id, session, token_type) for session in sessions)],
+        args=[
+            _digest(token),
+            ttl_ms,
+            now_ms + ttl_ms,
+            now_ms,
+            jti,
+            settings.MAX_SESSIONS_PER_USER,
+            REVOKE_CHANNEL,
+            str(user_id),
+            *sessions,
+        ],
+        client=redis_client,
+    )
+    if evicted:
+        token_cache.invalidate_user(user_id)
     return token_key
 
 
-async def get_tokens(
-    user_id: UUID,
+async def check_token(
+    user_id: str | None,
+    jti: str | None,
+    token: str,
     token_type: TokenType,
     redis_client: Redis | None = None,
-) -> Set[str]:
+) -> bool:
+    if not user_id or not jti:
+        return False
     redis_client = redis_client or get_ctx_client()
-    token_key = _gen_token_key(user_id, token_type)
-    valid_tokens = await redis_client.smembers(token_key)
-    return valid_tokens
+    digest = await redis_client.get(_gen_token_key(user_id, jti, token_type))
+    return digest == _digest(token)
 
 
 async def delete_tokens(
@@ -47,5 +130,13 @@ async def delete_tokens(
     redis_client: Redis | None = None,
 ):
     redis_client = redis_client or get_ctx_client()
-    token_key = _gen_token_key(user_id, token_type)
-    await redis_client.delete(token_key)
+    index_key = _gen_user_tokens_key(user_id, token_type)
+    # sessions issued between the read and the script outlive the revocation, as if issued after it
+    sessions = await redis_client.zrange(index_key, 0, -1)
+    script = redis_client.register_script(_REVOKE_ALL_SCRIPT)
+    await script(
+        keys=[index_key, *(_gen_token_key(user_id, session, token_type) for session in sessions)],
+        args=[REVOKE_CHANNEL, str(user_id), *sessions],
+        client=redis_client,
+    )
+    token_cache.invalidate_user(user_id)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from redis.asyncio import from_url
+
+from core.settings import settings
+from utils.ttl_cache import TTLCache
+
+REVOKE_CHANNEL = "token:revoke"
+
+
+class TokenCache:
+    """
+    In-process cache of already verified JWT payloads.
+
+    Entries never outlive the token `exp` claim. Revocations are broadcast on
+    `REVOKE_CHANNEL` so every worker drops the tokens of the revoked user. The
+    cache only serves entries while the subscription is alive, a lost Redis
+    connection disables it until the worker subscribes again.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache: TTLCache[str, Dict[str, Any]] = TTLCache(maxsize, ttl)
+        self.generation = 0
+        self.listening = False
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        if not self.listening:
+            return None
+        return self._cache.get(token)
+
+    def set(self, token: str, payload: Dict[str, Any], generation: int):
+        # a revocation received while the token was being checked invalidates the check
+        if not self.listening or generation != self.generation:
+            return
+        self._cache.set(token, payload, ttl=payload["exp"] - time.time())
+
+    def invalidate_user(self, user_id: UUID | str):
+        self.generation += 1
+        user_id = str(user_id)
+        self._cache.discard_if(lambda _, payload: payload.get("sub") == user_id)
+
+    def clear(self):
+        self.generation += 1
+        self._cache.clear()
+
+    async def listen(self, url: str, retry_interval: float = 1.0):
+        while True:
+            redis = from_url(url, decode_responses=True)
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(REVOKE_CHANNEL)
+                self.clear()
+                self.listening = True
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.invalidate_user(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Token revocation listener disconnected: {e}")
+            finally:
+                self.listening = False
+                self.clear()
+                await pubsub.reset()
+                await redis.close()
+            await asyncio.sleep(retry_interval)
+
+
+token_cache = TokenCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded in-process LRU cache whose entries expire after a time to live.
+    **Parameters**
+    * `maxsize`: Maximum number of entries, the least recently used entry is evicted first
+    * `ttl`: Maximum time to live of an entry in seconds
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> Optional[V]:
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def discard_if(self, predicate: Callable[[K, V], bool]) -> int:
+        keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,133 @@
+import time
+from typing import Any, Dict
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from core.jwt_codec import ExpiredSignatureError, JWTCodec, JWTError, get_backend
+
+SECRET = "KJMAgRxFdlijZPU8KLLWiJYsebxcDxpTMZDDqGRjJZg"
+
+
+def private_pem(algorithm: str) -> bytes:
+    if algorithm.startswith("RS"):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "ES256":
+        key = ec.generate_private_key(ec.SECP256R1())
+    elif algorithm == "ES384":
+        key = ec.generate_private_key(ec.SECP384R1())
+    else:
+        key = ed25519.Ed25519PrivateKey.generate()
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+def public_pem(pem: bytes) -> bytes:
+    key = serialization.load_pem_private_key(pem, password=None)
+    return key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def backend_algorithms(backend: str):
+    return [
+        (backend, algorithm)
+        for algorithm in ("HS256", "RS256", "ES256", "EdDSA")
+        if algorithm in get_backend(backend).algorithms
+    ]
+
+
+CASES = backend_algorithms("jose") + backend_algorithms("cryptography")
+
+
+def keys(backend: str, algorithm: str):
+    codec = JWTCodec(get_backend(backend), [algorithm])
+    if algorithm.startswith("HS"):
+        key = codec.backend.load_secret(SECRET, algorithm)
+        return codec, key, key
+    pem = private_pem(algorithm)
+    return (
+        codec,
+        codec.backend.load_private_key(pem, algorithm),
+        codec.backend.load_public_key(public_pem(pem), algorithm),
+    )
+
+
+def encode(codec: JWTCodec, key: Any, algorithm: str, **claims) -> str:
+    return codec.encode({"sub": "user", **claims}, key, algorithm)
+
+
+def decode(codec: JWTCodec, token: str, key: Any, **kwargs) -> Dict[str, Any]:
+    return codec.decode(token, lambda header: key, **kwargs)
+
+
+@pytest.mark.parametrize("backend,algorithm", CASES)
+def test_round_trip(backend: str, algorithm: str):
+    codec, signing_key, verifying_key = keys(backend, algorithm)
+    token = encode(codec, signing_key, algorithm, exp=int(time.time()) + 60)
+    assert decode(codec, token, verifying_key)["sub"] == "user"
+
+
+@pytest.mark.parametrize("backend,algorithm", CASES)
+def test_tampered_signature(backend: str, algorithm: str):
+    codec, signing_key, verifying_key = keys(backend, algorithm)
+    header, payload, signature = encode(codec, signing_key, algorithm).split(".")
+    forged = encode(codec, signing_key, algorithm, sub="admin").split(".")[1]
+    with pytest.raises(JWTError):
+        decode(codec, f"{header}.{forged}.{signature}", verifying_key)
+    with pytest.raises(JWTError):
+        decode(codec, f"{header}.{payload}.{signature[::-1]}", verifying_key)
+
+
+@pytest.mark.parametrize("backend", ["jose", "cryptography"])
+def test_algorithm_not_allowed(backend: str):
+    codec, signing_key, _ = keys(backend, "HS256")
+    token = encode(codec, signing_key, "HS256")
+    rs_codec = JWTCodec(get_backend(backend), ["RS256"])
+    with pytest.raises(JWTError, match="not allowed"):
+        decode(rs_codec, token, signing_key)
+
+
+@pytest.mark.parametrize("backend", ["jose", "cryptography"])
+def test_time_and_audience_claims(backend: str):
+    codec, key, _ = keys(backend, "HS256")
+    now = int(time.time())
+    with pytest.raises(ExpiredSignatureError):
+        decode(codec, encode(codec, key, "HS256", exp=now - 10), key)
+    assert decode(codec, encode(codec, key, "HS256", exp=now - 10), key, options={"leeway": 30})
+    with pytest.raises(JWTError):
+        decode(codec, encode(codec, key, "HS256", nbf=now + 60), key)
+    token = encode(codec, key, "HS256", aud="api")
+    assert decode(codec, token, key, audience="api")["aud"] == "api"
+    with pytest.raises(JWTError):
+        decode(codec, token, key, audience="other")
+    with pytest.raises(JWTError):
+        decode(codec, token, key)
+
+
+@pytest.mark.parametrize("backend", ["jose", "cryptography"])
+def test_public_key_is_not_an_hmac_secret(backend: str):
+    pem = public_pem(private_pem("RS256"))
+    backend = get_backend(backend)
+    with pytest.raises(JWTError):
+        backend.load_secret(pem, "HS256")
+    with pytest.raises(JWTError):
+        backend.load_public_key(pem, "HS256")
+
+
+def test_key_type_must_match_algorithm():
+    backend = get_backend("cryptography")
+    ec_pem = private_pem("ES256")
+    with pytest.raises(JWTError):
+        backend.load_public_key(public_pem(ec_pem), "RS256")
+    with pytest.raises(JWTError):
+        backend.load_private_key(ec_pem, "ES384")
+    with pytest.raises(JWTError):
+        backend.load_secret(SECRET, "RS256")
+
+    # a key prepared for another algorithm is a rejected token, not a TypeError
+    codec, signing_key, _ = keys("cryptography", "HS256")
+    token = encode(codec, signing_key, "HS256")
+    rsa_key = backend.load_public_key(public_pem(private_pem("RS256")), "RS256")
+    with pytest.raises(JWTError):
+        decode(codec, token, rsa_key)